@@ -1,18 +1,32 @@
 import os
 import logging
 
+from cachelib import FileSystemCache
 from dotenv import load_dotenv
 from flask import Flask
 from config import config
 from sqlalchemy.exc import OperationalError
 
-from .extensions import db, migrate, login_manager, csrf, session
+from .extensions import db, migrate, login_manager, csrf, session, render_cache, base_layers, row_strips, render_executor, statement_guard
 from .blueprints import auth, main, user, sitemap, month, object, group, debug, types, manage, holiday, abs
 from .cli import init_cli
 from . import errors
+from . import versions    # Register data version session events
+from . import segments    # Register absence_segments maintenance events
 
 load_dotenv()
 
+# Server side session unless SESSION_TYPE is cookie, which keeps Flask's signed cookie session
+def init_session(app):
+    if app.config['SESSION_TYPE'] == 'cookie':
+        return
+    if app.config['SESSION_TYPE'] == 'cachelib':
+        app.config['SESSION_CACHELIB'] = FileSystemCache(
+            os.path.join(app.instance_path, 'cache', 'session'),
+            threshold=app.config['SESSION_CACHE_THRESHOLD']
+        )
+    session.init_app(app)
+
 def create_app():
     app = Flask(__name__)
     env = os.getenv('FLASK_ENV', 'production')
@@ -41,13 +55,18 @@ def create_app():
     # Session will fail if the database is not created
     try:
         db.init_app(app)
-        session.init_app(app)
+        init_session(app)
     except OperationalError as e:
         pass
     
     # csrf.init_app(app)
     migrate.init_app(app, db, directory=migrations_dir)
     login_manager.init_app(app)
+    render_cache.init_app(app)
+    base_layers.init_app(app)
+    row_strips.init_app(app)
+    render_executor.init_app(app)
+    statement_guard.init_app(app)
 
     # Configure logger
     formatter = logging.Formatter(f'%(asctime)s %(levelname)s %(name)s : %(message)s')
@@ -0,0 +1,122 @@
+import time
+import random
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+from .extensions import db
+from .models import User, Group, UserGroup, Object, Absence, AbsenceSegment, AbsenceType, Holiday, DataVersion
+from .loader import objects_query, absences_query, holidays_query
+from .segments import segment_rows
+from .versions import month_keys
+
+"""
+Query plan audit of calendar hot queries.
+Synthetic group is inserted inside a transaction which is rolled back at the end,
+so the audit can be run against a live database.
+"""
+
+AUDIT_GROUP = '__db_audit__'
+
+def insert_rows(model, rows):
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+
+# Insert synthetic group with given number of objects and absences spread over three years
+# Return (user_id, group_id, first_object_id)
+def seed_audit_data(objects, absences_per_object, seed=1):
+    rnd = random.Random(seed)
+    user = User(username=AUDIT_GROUP, password=generate_password_hash(AUDIT_GROUP), admin=False)
+    db.session.add(user)
+    db.session.flush()
+    group = Group(user_id=user.id, name=AUDIT_GROUP, description='Synthetic data of db-audit')
+    db.session.add(group)
+    db.session.flush()
+    db.session.add(UserGroup(user_id=user.id, group_id=group.id))
+
+    type_ids = [row.id for row in db.session.query(AbsenceType.id).all()] or [None]
+    first_day = date(date.today().year - 1, 1, 1)
+
+    insert_rows(Object, [{'user_id': user.id, 'group_id': group.id, 'name': f'Audit {i}', 'description': ''} for i in range(objects)])
+    object_ids = [row.id for row in db.session.query(Object.id).filter(Object.group_id == group.id).order_by(Object.id)]
+
+    absence_rows = []
+    for object_id in object_ids:
+        day = first_day
+        for _ in range(absences_per_object):
+            day += timedelta(days=rnd.randint(5, 60))
+            absence_rows.append({
+                'object_id': object_id,
+                'type_id': rnd.choice(type_ids),
+                'abs_date_start': day,
+                'abs_date_end': day + timedelta(days=rnd.randint(0, 14)),
+                'description': 'Audit'
+            })
+    insert_rows(Absence, absence_rows)
+
+    absences = db.session.query(Absence.id, Absence.object_id, Absence.abs_date_start, Absence.abs_date_end)\
+        .filter(Absence.object_id.in_(object_ids)).all()
+    segments = []
+    for absence in absences:
+        segments.extend(segment_rows(absence.id, absence.object_id, group.id, absence.abs_date_start, absence.abs_date_end))
+    insert_rows(AbsenceSegment, segments)
+
+    insert_rows(Holiday, [{'country': 'xx', 'event_date': first_day + timedelta(days=7*i), 'description': 'Audit', 'recurring': False}
+                          for i in range(150)])
+
+    return user.id, group.id, object_ids[0] if object_ids else None
+
+# Return list of (name, statement) of calendar hot queries
+def hot_queries(app_conf, user_id, group_id, object_id):
+    today = date.today()
+    start = date(today.year, today.month, 1)
+    end = date(today.year + 1, today.month, 1)
+
+    return [
+        ('objects of group', objects_query(app_conf, group_id).statement),
+        ('absences of 13 months', absences_query(app_conf, group_id, start, end).statement),
+        ('holidays of 13 months', holidays_query(start, end).statement),
+        ('data versions', db.session.query(DataVersion).filter(DataVersion.name.in_(month_keys(group_id, today.year, today.month))).statement),
+        ('groups of user', db.session.query(Group).join(UserGroup).filter(UserGroup.user_id == user_id).distinct().statement),
+        ('members of group', db.session.query(UserGroup).filter(UserGroup.group_id == group_id).statement),
+        ('absence overlap check', db.session.query(Absence).filter(
+            Absence.object_id == object_id,
+            Absence.abs_date_start >= start,
+            Absence.abs_date_end <= end
+        ).statement),
+    ]
+
+# sql - statement with literal values, psycopg2 interpolates parameters on the client, so it is what PostgreSQL plans
+def explain(sql, dialect):
+    if dialect == 'sqlite':
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return [row[-1] for row in rows]
+    elif dialect == 'postgresql':
+        rows = db.session.execute(text(f'EXPLAIN ANALYZE {sql}')).all()
+        return [row[0] for row in rows]
+    else:
+        raise ValueError(f"Unsupported database dialect: {dialect}")
+
+# Seed synthetic data, print plan and timing of every hot query and roll everything back
+# Yields lines of report
+def run_audit(objects=300, absences_per_object=20, repeat=20):
+    dialect = db.get_engine().dialect.name
+    try:
+        user_id, group_id, object_id = seed_audit_data(objects, absences_per_object)
+        db.session.execute(text('ANALYZE'))
+        yield f"Dialect: {dialect}. Synthetic group: {objects} objects, {objects*absences_per_object} absences"
+
+        for name, statement in hot_queries(current_app.config, user_id, group_id, object_id):
+            sql = str(statement.compile(dialect=db.get_engine().dialect, compile_kwargs={'literal_binds': True}))
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rows = db.session.execute(statement).all()
+            elapsed = (time.perf_counter() - start) * 1000 / repeat
+
+            yield ''
+            yield f"== {name}: {elapsed:.2f} ms, {len(rows)} rows"
+            for line in explain(sql, dialect):
+                yield f"   {line}"
+    finally:
+        db.session.rollback()
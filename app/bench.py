@@ -0,0 +1,252 @@
+import io
+import os
+import time
+import random
+import calendar
+import click
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+from flask import current_app
+from flask.cli import AppGroup
+from flask_login import login_user
+from PIL import ImageFont
+from .fonts import TTF_DIR, DEFAULT_FACE, get_font
+from .image import AbsMonth
+from .layout import ROW_HEIGHT
+from .raster import encode_png, rasterize, iter_png, render_options
+from .executor import RenderExecutor
+from .extensions import base_layers, row_strips
+from .models import User
+
+"""
+Rendering benchmarks.
+Run with: flask bench <name>
+"""
+
+bench = AppGroup('bench', help="Run rendering benchmarks")
+
+# Return average milliseconds of given number of calls of fn
+def measure(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def report(name, before, after):
+    saving = (1 - after / before) * 100 if before else 0
+    click.echo(f"{name:<20} before: {before:8.3f} ms  after: {after:8.3f} ms  saving: {saving:5.1f}%")
+
+# Rows shaped like results of AbsMonth.find_objects and AbsMonth.find_absences
+BenchObject = namedtuple('BenchObject', ['id', 'user_id', 'group_id', 'owner', 'group_name', 'object_name', 'description'])
+BenchAbsence = namedtuple('BenchAbsence', ['id', 'object_id', 'group_id', 'user_id', 'type_id', 'abs_date_start', 'abs_date_end',
+                                           'duration', 'description', 'at_color', 'at_name'])
+
+COLORS = ['#FFA500', '#CE1616', '#5A5AFF', '#51AC4E', '#A020F0']
+
+# Return synthetic group of given size with a few absences per object in given month
+def synthetic_group(size, year, month, absences_per_object=3, seed=1):
+    rnd = random.Random(seed)
+    days = calendar.monthrange(year, month)[1]
+    objects = []
+    absences = []
+    for object_id in range(1, size+1):
+        objects.append(BenchObject(object_id, 1, 1, 'bench', 'Bench', f'Person {object_id}', None))
+        day = 1
+        for _ in range(absences_per_object):
+            day += rnd.randint(1, 5)
+            duration = rnd.randint(1, 4)
+            if day + duration - 1 > days:
+                break
+            type_id = rnd.randint(1, len(COLORS))
+            absences.append(BenchAbsence(len(absences)+1, object_id, 1, 1, type_id, date(year, month, day),
+                                         date(year, month, day+duration-1), duration, 'Trip', COLORS[type_id-1], 'Type'))
+            day += duration
+    return objects, absences
+
+# Request context with synthetic admin user, required by image map generation
+@contextmanager
+def bench_context():
+    with current_app.test_request_context('/'):
+        login_user(User(id=0, username='bench', admin=True))
+        yield
+
+# Fit caption into box removing one character at a time, the way mark_day does
+def fit_caption(caption, box_width, textlength):
+    text_width = textlength(caption)
+    while text_width > box_width and len(caption) > 0:
+        caption = caption[:-1]
+        text_width = textlength(caption)
+    return caption
+
+@bench.command('fonts', help="Font loading and text measuring cost of one month render")
+@click.option('--renders', default=100, help="Number of simulated renders")
+@click.option('--captions', default=50, help="Absence captions fitted per render")
+def bench_fonts(renders, captions):
+    ttf = os.path.join(TTF_DIR, f'{DEFAULT_FACE}.ttf')
+    caption = 'Business trip to the main office'
+    box_width = 3 * 26 - 2
+
+    def before():
+        font = ImageFont.truetype(ttf, 13)
+        ImageFont.truetype(ttf, 20)
+        for _ in range(captions):
+            fit_caption(caption, box_width, font.getlength)
+
+    def after():
+        metrics = get_font(13)
+        get_font(20)
+        for _ in range(captions):
+            metrics.fit(caption, box_width)
+
+    get_font(13)
+    click.echo(f"{renders} renders, {captions} captions per render")
+    report('per render', measure(before, renders), measure(after, renders))
+
+# Row lookups done by AbsMonth before object/row indexes were added
+def linear_lookups(objects, absences):
+    order = {row: obj.id for row, obj in enumerate(objects, start=2)}
+    for absence in absences:
+        next((k for k, v in order.items() if v == absence.object_id), None)
+    for obj in objects:
+        next((k for k, v in order.items() if v == obj.id), None)
+    for row, object_id in order.items():
+        next((obj for obj in objects if obj.id == object_id), None)
+
+@bench.command('rows', help="Month render time for growing synthetic groups")
+@click.option('--sizes', default='250,500,1000,2000', help="Comma separated group sizes")
+@click.option('--repeat', default=3, help="Renders per group size")
+def bench_rows(sizes, repeat):
+    year, month = date.today().year, date.today().month
+    with bench_context():
+        for size in [int(size) for size in sizes.split(',')]:
+            objects, absences = synthetic_group(size, year, month)
+            render = measure(lambda: AbsMonth(current_app.config, year, month, objects, absences).get_image(), repeat)
+            map_only = measure(lambda: AbsMonth(current_app.config, year, month, objects, absences), repeat)
+            lookups = measure(lambda: linear_lookups(objects, absences), 1)
+            click.echo(f"{size:>6} objects  render: {render:9.1f} ms  per object: {render*1000/size:7.1f} us  "
+                       f"map only: {map_only:9.1f} ms  old row lookups alone: {lookups:9.1f} ms")
+
+@bench.command('png', help="Size and encode time of month PNG, RGB with default settings vs configured output")
+@click.option('--sizes', default='250,1000,2000', help="Comma separated group sizes")
+@click.option('--repeat', default=3, help="Encodes per group size")
+def bench_png(sizes, repeat):
+    year, month = date.today().year, date.today().month
+    config = current_app.config
+    click.echo(f"palette: {config['PNG_PALETTE']}  level: {config['PNG_COMPRESS_LEVEL']}  strategy: {config['PNG_COMPRESS_TYPE']}")
+    with bench_context():
+        for size in [int(size) for size in sizes.split(',')]:
+            objects, absences = synthetic_group(size, year, month)
+            abs_month = AbsMonth(config, year, month, objects, absences)
+            image = abs_month.get_image()
+
+            def before():
+                buffer = io.BytesIO()
+                image.save(buffer, 'PNG')
+                return buffer.getvalue()
+
+            before_bytes = len(before())
+            after_bytes = len(encode_png(image, abs_month.layout))
+            click.echo(f"{size:>6} objects  before: {before_bytes/1024:8.0f} KiB  after: {after_bytes/1024:8.0f} KiB")
+            report('  encode', measure(before, repeat), measure(lambda: encode_png(image, abs_month.layout), repeat))
+
+@bench.command('bands', help="Month PNG rendered as one image vs in bands of PNG_BAND_ROWS rows")
+@click.option('--sizes', default='500,1500', help="Comma separated group sizes")
+@click.option('--repeat', default=1, help="Renders per group size")
+def bench_bands(sizes, repeat):
+    year, month = date.today().year, date.today().month
+    config = current_app.config
+    band_rows = config['PNG_BAND_ROWS'] or 64
+    with bench_context():
+        for size in [int(size) for size in sizes.split(',')]:
+            objects, absences = synthetic_group(size, year, month)
+            layout = AbsMonth(config, year, month, objects, absences).layout
+            full_buffer = layout.width * layout.height * 3
+            band_buffer = layout.width * min(layout.height, band_rows * (ROW_HEIGHT+1)) * 3
+            click.echo(f"{size:>6} objects  raster buffer: {full_buffer/2**20:7.1f} MiB -> {band_buffer/2**20:5.1f} MiB")
+            encode_png(rasterize(layout), layout)    # Warm up font atlas and base layer
+            report('  render + encode',
+                   measure(lambda: encode_png(rasterize(layout), layout), repeat),
+                   measure(lambda: b''.join(iter_png(layout)), repeat))
+
+@bench.command('strips', help="Month render after one absence change, with and without row strip cache")
+@click.option('--size', default=300, help="Group size")
+@click.option('--repeat', default=5, help="Renders per case")
+def bench_strips(size, repeat):
+    year, month = date.today().year, date.today().month
+    config = current_app.config
+    with bench_context():
+        objects, absences = synthetic_group(size, year, month)
+        rasterize(AbsMonth(config, year, month, objects, absences).layout)    # Warm up font atlas
+
+        # Every render moves the first absence by one day, so its row is new to the cache
+        def edited(shift):
+            first = absences[0]._replace(abs_date_start=absences[0].abs_date_start.replace(day=1+shift % 3))
+            return AbsMonth(config, year, month, objects, [first] + absences[1:]).layout
+
+        layouts = [edited(i) for i in range(repeat*2)]
+
+        def cold():
+            base_layers.clear()
+            row_strips.clear()
+            rasterize(layouts.pop())
+
+        def warm():
+            rasterize(layouts.pop())
+
+        click.echo(f"{size} objects, one absence changed before every render")
+        report('render', measure(cold, repeat), measure(warm, repeat))
+
+@bench.command('strip-cache', help="Row strip cache hit rate over a month window after one absence change")
+@click.option('--size', default=300, help="Group size")
+@click.option('--months', default=13, help="Months in the window")
+def bench_strip_cache(size, months):
+    today = date.today()
+    config = current_app.config
+    window = [((today.year*12 + today.month-1 + i) // 12, (today.year*12 + today.month-1 + i) % 12 + 1) for i in range(months)]
+    with bench_context():
+        groups = {(year, month): synthetic_group(size, year, month) for year, month in window}
+        base_layers.clear()
+        row_strips.clear()
+
+        def render_window(changed=None):
+            for year, month in window:
+                objects, absences = groups[(year, month)]
+                if (year, month) == changed:
+                    first = absences[0]._replace(abs_date_start=absences[0].abs_date_start.replace(day=1))
+                    absences = [first] + absences[1:]
+                rasterize(AbsMonth(config, year, month, objects, absences).layout)
+
+        cold = measure(render_window, 1)
+        row_strips.hits = row_strips.misses = 0
+        warm = measure(lambda: render_window(window[0]), 1)
+        lookups = row_strips.hits + row_strips.misses
+        click.echo(f"{size} objects x {months} months, one absence changed, cache: {row_strips.max_bytes/2**20:.0f} MiB")
+        click.echo(f"row strips: {len(row_strips.items)}  cached: {row_strips.size/2**20:.1f} MiB  "
+                   f"hit rate: {row_strips.hits*100/lookups:.1f}% ({row_strips.misses} rows drawn again)")
+        report('window', cold, warm)
+
+@bench.command('executor', help="Encoding of a month chunk in the request process vs in RENDER_WORKERS pool processes")
+@click.option('--size', default=100, help="Group size")
+@click.option('--months', default=4, help="Months in the chunk")
+@click.option('--workers', default=4, help="Pool processes")
+@click.option('--repeat', default=3, help="Encodes of the chunk")
+def bench_executor(size, months, workers, repeat):
+    today = date.today()
+    config = current_app.config
+    window = [((today.year*12 + today.month-1 + i) // 12, (today.year*12 + today.month-1 + i) % 12 + 1) for i in range(months)]
+    with bench_context():
+        # Every encode gets a chunk with other absences, so row strips are drawn in both cases
+        chunks = [[(AbsMonth(config, year, month, *synthetic_group(size, year, month, seed=seed)).layout, 'png') for year, month in window]
+                  for seed in range(repeat*2 + 1)]
+        pool = RenderExecutor()
+        pool.workers = workers
+        pool.options = render_options(config)
+        pool.encode(chunks.pop())    # Start pool processes and load fonts
+
+        def serial():
+            [encode_png(rasterize(layout), layout) for layout, fmt in chunks.pop()]
+
+        click.echo(f"{months} months of {size} objects, {workers} pool processes, {os.cpu_count()} CPUs")
+        report('chunk', measure(serial, repeat), measure(lambda: pool.encode(chunks.pop()), repeat))
+        pool.reset()
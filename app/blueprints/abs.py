@@ -4,10 +4,12 @@ from flask import Blueprint, current_app, request, render_template, url_for, fla
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func, cast, Integer
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import redirect as safe_redirect
 from ..extensions import db
+from .. import refdata
 from ..forms import AbsenceForm, NavForm, PrevNextForm
-from ..models import Absence, AbsenceType, Object, Group, User
+from ..models import Absence, AbsenceType, Object, Group
 
 bp = Blueprint("abs", __name__)
 
@@ -51,7 +53,7 @@ def index():
 
     # If user is not admin filter only absences related to user's groups
     if not current_user.admin:
-        query = query.filter(Object.group_id.in_([group.id for group in current_user.groups]))
+        query = query.filter(Object.group_id.in_([group.id for group in refdata.user_groups(current_user.id)]))
 
     absences = query.all()
 
@@ -74,18 +76,9 @@ def create(object_id=None, day=None, month=None, year=None, goback=0):
     if 'referrer' not in session and goback==1:
         session['referrer'] = request.referrer
 
-    abs_types = db.session.query(AbsenceType).all()
-    absence_types = [(str(abs_type.id), abs_type.name) for abs_type in abs_types]   # Convert to list of tuples
+    absence_types = refdata.type_choices()
 
-    object_query = Object.query.filter(
-        Object.group_id.in_([group.id for group in current_user.groups])
-    )
-
-    if not current_app.config['SHOW_ALL_GROUP_OBJECTS']:
-        object_query = object_query.filter(Object.user_id == current_user.id)
-
-    objects = object_query.all()
-    objects_types = [(str(obj.id), obj.group.name+" " + obj.name) for obj in objects]    # Convert to list of tuples
+    objects_types = refdata.object_choices(current_app.config, current_user)
 
     input_data = {
         'object_id': object_id,
@@ -111,18 +104,9 @@ def create_post():
     prevnextform = PrevNextForm()
     form = AbsenceForm()
 
-    abs_types = db.session.query(AbsenceType).all()
-    absence_types = [(str(abs_type.id), abs_type.name) for abs_type in abs_types]
-
-    object_query = Object.query.filter(
-        Object.group_id.in_([group.id for group in current_user.groups])
-    )
-
-    if not current_app.config['SHOW_ALL_GROUP_OBJECTS']:
-        object_query = object_query.filter(Object.user_id == current_user.id)
+    absence_types = refdata.type_choices()
 
-    objects = object_query.all()
-    objects_types = [(str(obj.id), obj.group.name+" " + obj.name) for obj in objects]    # Convert to list of tuples
+    objects_types = refdata.object_choices(current_app.config, current_user)
 
     form.object_id.choices = objects_types
     form.type_id.choices = absence_types
@@ -130,7 +114,9 @@ def create_post():
 
     if form.validate_on_submit():
         try:
+            # Object loaded by the validators, segments take its group without a query
             new_absence = Absence(
+                object=form.chosen_object,
                 object_id=form.object_id.data,
                 type_id=form.type_id.data,
                 abs_date_start=form.abs_date_start.data,
@@ -170,21 +156,12 @@ def edit(id):
     navform = NavForm()
     prevnextform = PrevNextForm()
 
-    abs_types = db.session.query(AbsenceType).all()
-    absence_types = [(str(abs_type.id), abs_type.name) for abs_type in abs_types]   # Convert to list of tuples
+    absence_types = refdata.type_choices()
 
-    object_query = Object.query.filter(
-        Object.group_id.in_([group.id for group in current_user.groups])
-    )
-
-    if not current_app.config['SHOW_ALL_GROUP_OBJECTS']:
-        object_query = object_query.filter(Object.user_id == current_user.id)
-
-    objects = object_query.all()
-    objects_types = [(str(obj.id), obj.group.name+" " + obj.name) for obj in objects]    # Convert to list of tuples
+    objects_types = refdata.object_choices(current_app.config, current_user)
 
     try:
-        absence = db.session.get(Absence, id)     
+        absence = db.session.get(Absence, id, options=[joinedload(Absence.object)])
 
         if not current_app.config['MODIFY_ALL_GROUP_ABSENCES']:
             if absence.object.user_id != current_user.id:
@@ -219,18 +196,9 @@ def edit_post():
     prevnextform = PrevNextForm()
     form = AbsenceForm()
 
-    abs_types = db.session.query(AbsenceType).all()
-    absence_types = [(str(abs_type.id), abs_type.name) for abs_type in abs_types]
-
-    object_query = Object.query.filter(
-        Object.group_id.in_([group.id for group in current_user.groups])
-    )
-
-    if not current_app.config['SHOW_ALL_GROUP_OBJECTS']:
-        object_query = object_query.filter(Object.user_id == current_user.id)
+    absence_types = refdata.type_choices()
 
-    objects = object_query.all()
-    objects_types = [(str(obj.id), obj.group.name+" " + obj.name) for obj in objects]    # Convert to list of tuples
+    objects_types = refdata.object_choices(current_app.config, current_user)
 
     form.object_id.choices = objects_types
     form.type_id.choices = absence_types
@@ -270,9 +238,8 @@ def edit_post():
 @login_required
 def delete(id):
 
-    user = User.query.get_or_404(current_user.id)
-    user_groups = [(group.id, group.name) for group in user.groups]
-    absence = Absence.query.get(id)
+    user_groups = refdata.group_choices(current_user.id)
+    absence = db.session.get(Absence, id, options=[joinedload(Absence.object)])
 
     if absence:
         if current_user.admin:
@@ -7,13 +7,15 @@ from werkzeug.utils import redirect as safe_redirect
 
 from ..extensions import login_manager
 from ..models import User
+from ..principal import load_principal
 
 bp = Blueprint('auth', __name__)
 
     
+# Cached principal instead of User row, see principal.py
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_principal(int(user_id))
 
 @bp.route('/login')
 def login():
@@ -1,8 +1,14 @@
 import os
-from datetime import datetime, date
-from flask import Response, Blueprint, flash, redirect, render_template, session, url_for, current_app, send_from_directory
+from datetime import datetime
+from flask import Response, Blueprint, flash, redirect, render_template, url_for, current_app, send_from_directory
 from flask_login import login_required, current_user
-from ..image import AbsMonth
+from werkzeug.exceptions import HTTPException
+from ..extensions import render_executor
+from ..refdata import REFERENCE_KEYS
+from ..render import get_month_renders, image_format
+from ..sheet import sheet_maps, MAP_NAME
+from ..versions import prefetch_month_versions
+from ..view import ViewWindow, view_window, remember_window, window_args, shift_window, window_in_range
 from ..forms import NavForm, PrevNextForm
 
 def generate_dates(start_month, start_year, N):
@@ -17,53 +23,66 @@ def generate_dates(start_month, start_year, N):
     
     return dates
 
-def add_months(givendate, months):
-    # Calculate the target month and year
-    total_months = givendate.month - 1 + months
-    new_year = givendate.year + total_months // 12
-    new_month = total_months % 12 + 1
-    # Handle cases where the new day exceeds the last day of the new month
-    # Safely calculate the last day of the target month
-    if new_month == 12:  # December, next month is January of next year
-        next_month_start = date(new_year + 1, 1, 1)
-    else:
-        next_month_start = date(new_year, new_month + 1, 1)
-    last_day_of_new_month = (next_month_start - date(new_year, new_month, 1)).days
-    new_day = min(givendate.day, last_day_of_new_month)
-    return date(new_year, new_month, new_day)
-
 bp = Blueprint("main", __name__)
 
 @bp.route("/")
 @login_required
 def index():
-    chunksize = session.get("chunksize", 4)
-    start_month = session.get("start_month", datetime.today().month)
-    start_year = session.get("start_year", datetime.today().year)
+    window = view_window()
+    remember_window(window)
+
+    # Reference data of the navigation form is validated with the same query as the months
+    dates = generate_dates(window.start_month, window.start_year, window.chunksize)
+    prefetch_month_versions(window.group_id, dates, REFERENCE_KEYS)
 
     navform = NavForm()
     prevnextform = PrevNextForm()
 
-    dates = generate_dates(start_month, start_year, chunksize)
-    img_maps = []
-    for date in dates:
-        year = date.year
-        month = date.month
-        img_map = AbsMonth(current_app.config, year, month).img_map
-        img_maps.append(img_map)
-
-    return render_template("main/index.html", img_maps=img_maps, dates=dates, navform=navform, prevnextform=prevnextform)
+    sheet = current_app.config['SPRITE_SHEET']
+    # With render executor the images browser asks for next are encoded concurrently right away
+    fmt = image_format() if render_executor.enabled and not sheet else None
+    artifacts = get_month_renders(current_app.config, [(date.year, date.month) for date in dates], fmt)
 
+    if sheet:
+        # One image of legend and all months with one merged image map
+        img_map, click_maps = sheet_maps(artifacts)
+        img_maps = [img_map]
+    else:
+        img_maps = [artifact['img_map'] for artifact in artifacts]
+        click_maps = [artifact['click_map'] for artifact in artifacts]
+
+    return render_template("main/index.html", img_maps=img_maps, click_maps=click_maps, dates=dates, sheet=sheet, sheet_map=MAP_NAME,
+                           group_id=window.group_id, navform=navform, prevnextform=prevnextform)
+
+# Prev and Next links of the navigation bar are plain links to the neighbouring windows
+# A link is None when its window falls outside of the calendar range
+@bp.app_context_processor
+def navigation_links():
+    if not current_user.is_authenticated:
+        return {}
+    try:
+        window = view_window()
+    except HTTPException:
+        return {}
+    return {
+        'prev_url': window_url(shift_window(window, -window.chunksize)),
+        'next_url': window_url(shift_window(window, window.chunksize))
+    }
+
+def window_url(window):
+    if not window_in_range(window):
+        return None
+    return url_for('main.index', **window_args(window))
+
+# Former POST navigation, redirects to the URL of the chosen window
 @bp.route("/submit", methods=["POST"])
 @login_required
 def submit():
     navform = NavForm()
     if navform.validate_on_submit():
-        session['group_id'] = navform.group_id.data
-        session["chunksize"] = navform.chunksize.data
-        session["start_month"] = navform.start_month.data
-        session["start_year"] = navform.start_year.data
+        window = ViewWindow(navform.group_id.data, navform.start_year.data, navform.start_month.data, navform.chunksize.data)
         current_app.logger.info(f"{navform.chunksize.data=}, {navform.start_month.data=}, {navform.start_year.data=}")
+        return redirect(url_for("main.index", **window_args(window)))
     else:
         flash(f"Input invalid: {navform.errors}")
         current_app.logger.info(f"Input invalid {navform.errors}")
@@ -75,21 +94,17 @@ def submit():
 def navigation():
     prevnextform = PrevNextForm()
     if prevnextform.validate_on_submit():
-
-        chunksize = session.get("chunksize", 4)
-        start_month = session.get("start_month", datetime.today().month)
-        start_year = session.get("start_year", datetime.today().year)
-
-        givendate = date(start_year, start_month, 1)
-        prevdate = add_months(givendate, -chunksize)
-        nextdate = add_months(givendate, chunksize)
-
+        window = view_window()
         if prevnextform.prev.data:
-            session["start_month"] = prevdate.month
-            session["start_year"] = prevdate.year
+            shifted = shift_window(window, -window.chunksize)
         elif prevnextform.next.data:
-            session["start_month"] = nextdate.month
-            session["start_year"] = nextdate.year
+            shifted = shift_window(window, window.chunksize)
+        else:
+            shifted = window
+        # Stay on the current window at the ends of the calendar range
+        if window_in_range(shifted):
+            window = shifted
+        return redirect(url_for("main.index", **window_args(window)))
     else:
         current_app.logger.info(f"Input invalid {prevnextform.errors}")
 
@@ -1,8 +1,14 @@
 
-import io
-from flask import Blueprint, Response, current_app
+import base64
+from datetime import date
+from flask import Blueprint, Response, current_app, request, stream_with_context, jsonify, abort
+from flask_login import login_required
 from ..image import AbsMonth
-from ..legend import Legend
+from ..loader import next_month
+from ..render import get_month_image, month_image_format, get_month_renders, get_sheet_image, get_legend_image, month_render_info, image_format, served_format, IMAGE_FORMATS
+from ..render import render_etag, sheet_etag, legend_etag
+from ..versions import types_version, prefetch_month_versions
+from ..view import view_group_id, months_in_range
 
 """
 This blueprint is generating month images
@@ -16,27 +22,135 @@ def find_absence_day(absences, day):
     return None
 
 
+# Add validators and revalidation policy to image response
+def set_cache_headers(response, etag, last_modified):
+  response.set_etag(etag)
+  if last_modified:
+    response.last_modified = last_modified
+
+  max_age = current_app.config['IMAGE_CACHE_MAX_AGE']
+  response.cache_control.private = True
+  if max_age:
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+  else:
+    response.cache_control.no_cache = True
+  return response
+
+# Return 304 response if browser already has the image with given etag, else None
+def not_modified(etag, last_modified):
+  if request.if_none_match.contains(etag):
+    return set_cache_headers(Response(status=304), etag, last_modified)
+  return None
+
 bp = Blueprint("month", __name__)
 
 @bp.route('/month/<int:year>/<int:month>')
 @bp.route('/month')
 def month(year = None, month = None):
-  month = AbsMonth(current_app.config, year, month)
-  buffer = io.BytesIO()
-  img = month.get_image()
-  img.save(buffer, 'PNG')
-  return Response(buffer.getvalue(), mimetype='image/png')
+  if year is not None and not months_in_range(year, month, 1):
+    abort(404)
+  info = month_render_info(current_app.config, year, month)
+  fmt, artifact = month_image_format(current_app.config, info, image_format())
+  etag = render_etag(info['key'], fmt)
+  last_modified = info['version'].last_modified
+
+  response = not_modified(etag, last_modified)
+  if response:
+    response.vary.add('Accept')
+    return response
+
+  body = get_month_image(current_app.config, info, fmt, artifact)
+  if not isinstance(body, bytes):
+    body = stream_with_context(body)
+  response = set_cache_headers(Response(body, mimetype=IMAGE_FORMATS[fmt]), etag, last_modified)
+  response.vary.add('Accept')
+  return response
+
+MAX_MONTHS = 24
+
+# Return [(year, month)] of count months starting with given one and prefetch their data versions
+def month_window(year, month, count):
+  if not 1 <= count <= MAX_MONTHS or not months_in_range(year, month, count):
+    abort(404)
+
+  months = [(year, month)]
+  while len(months) < count:
+    months.append(next_month(*months[-1]))
+  prefetch_month_versions(view_group_id(), [date(y, m, 1) for y, m in months])
+  return months
+
+# Images of count months starting with given one in one response, encoded concurrently by render executor
+# [{year, month, format, mimetype, etag, width, height, data}], data is base64 encoded image
+@bp.route('/months/<int:year>/<int:month>/<int:count>')
+@login_required
+def months(year, month, count):
+  months = month_window(year, month, count)
+
+  fmt = image_format()
+  result = []
+  for artifact in get_month_renders(current_app.config, months, fmt):
+    served = served_format(artifact, fmt)
+    key = month_render_info(current_app.config, artifact['year'], artifact['month'])['key']
+    result.append({
+      'year': artifact['year'],
+      'month': artifact['month'],
+      'format': served,
+      'mimetype': IMAGE_FORMATS[served],
+      'etag': render_etag(key, served),
+      'width': artifact['width'],
+      'height': artifact['height'],
+      'data': base64.b64encode(artifact[served]).decode()
+    })
+
+  response = jsonify(result)
+  response.vary.add('Accept')
+  return response
+
+# Legend and count months starting with given one stacked in one image (see sheet.py)
+# Image map of the sheet is rendered into the page by main.index
+@bp.route('/sheet/<int:year>/<int:month>/<int:count>')
+@login_required
+def sheet(year, month, count):
+  months = month_window(year, month, count)
+
+  fmt = image_format()
+  infos = [month_render_info(current_app.config, y, m) for y, m in months]
+  types = types_version()
+  etag = sheet_etag(infos, types, fmt)
+  modified = [stamp.last_modified for stamp in [types] + [info['version'] for info in infos] if stamp.last_modified]
+  last_modified = max(modified) if modified else None
+
+  response = not_modified(etag, last_modified)
+  if response:
+    response.vary.add('Accept')
+    return response
+
+  fmt, body = get_sheet_image(current_app.config, months, etag, fmt)
+  if not isinstance(body, bytes):
+    body = stream_with_context(body)
+  response = set_cache_headers(Response(body, mimetype=IMAGE_FORMATS[fmt]), etag, last_modified)
+  response.vary.add('Accept')
+  return response
 
 @bp.route('/legend')
 def legend():
-  legend = Legend(current_app.config)
-  buffer = io.BytesIO()
-  img = legend.get_image()
-  img.save(buffer, 'PNG')
-  return Response(buffer.getvalue(), mimetype='image/png')
+  fmt = image_format()
+  version = types_version()
+  etag = legend_etag(version, fmt)
+
+  response = not_modified(etag, version.last_modified)
+  if response:
+    response.vary.add('Accept')
+    return response
+
+  body = get_legend_image(current_app.config, version, fmt)
+  response = set_cache_headers(Response(body, mimetype=IMAGE_FORMATS[fmt]), etag, version.last_modified)
+  response.vary.add('Accept')
+  return response
 
 
 @bp.route('/debugimage')
 def debugimage():
-  month = AbsMonth(current_app.config)
+  month = AbsMonth(current_app.config, group_id=view_group_id())
   return month.holiday_caption
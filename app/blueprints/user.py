@@ -4,6 +4,7 @@ from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash
 from ..extensions import db
+from .. import refdata
 from ..forms import UserForm, NavForm, PrevNextForm
 from ..models import User, Group, UserGroup
 
@@ -74,10 +75,7 @@ def edit(id):
     try:
         user = db.session.get(User, id)
 
-        groups = db.session.query(Group).join(UserGroup).filter(
-            UserGroup.user_id == id,
-            UserGroup.group_id == Group.id
-        ).distinct().all()
+        groups = refdata.user_groups(id)
 
     except SQLAlchemyError as e:
         flash('Error getting user data from database')
@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+from cachelib import FileSystemCache
+
+"""
+Render cache shared by all gunicorn workers.
+Backed by cachelib FileSystemCache stored in the instance directory so
+whichever worker renders a month, the other workers can serve it.
+
+LayerCache is a per worker in memory LRU of pre-rendered image layers,
+bounded by total size in bytes instead of number of entries.
+"""
+
+class RenderCache:
+  def __init__(self, app=None):
+    self.cache = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    cache_dir = app.config.get('RENDER_CACHE_DIR') or os.path.join(app.instance_path, 'cache', 'render')
+    if not os.path.exists(cache_dir):
+      os.makedirs(cache_dir)
+
+    self.cache = FileSystemCache(
+      cache_dir,
+      threshold=app.config.get('RENDER_CACHE_THRESHOLD', 500),
+      default_timeout=app.config.get('RENDER_CACHE_TIMEOUT', 300)
+    )
+
+  def get(self, key):
+    if self.cache is None:
+      return None
+    return self.cache.get(key)
+
+  def set(self, key, value, timeout=None):
+    if self.cache is None:
+      return False
+    return self.cache.set(key, value, timeout=timeout)
+
+  def delete(self, key):
+    if self.cache is None:
+      return False
+    return self.cache.delete(key)
+
+  def clear(self):
+    if self.cache is None:
+      return False
+    return self.cache.clear()
+
+class LayerCache:
+  # size_key - config key of max total size in bytes
+  def __init__(self, app=None, size_key='BASE_LAYER_CACHE_BYTES'):
+    self.size_key = size_key
+    self.max_bytes = 0
+    self.size = 0
+    self.items = OrderedDict()    # {key: (value, nbytes)}, least recently used first
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.resize(app.config.get(self.size_key, 64*1024*1024))
+
+  def resize(self, max_bytes):
+    self.max_bytes = max_bytes
+
+  def get(self, key):
+    with self.lock:
+      item = self.items.get(key)
+      if item is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self.items.move_to_end(key)
+      return item[0]
+
+  # Values bigger than the whole cache are not stored
+  def set(self, key, value, nbytes):
+    if nbytes > self.max_bytes:
+      return False
+    with self.lock:
+      old = self.items.pop(key, None)
+      if old is not None:
+        self.size -= old[1]
+      self.items[key] = (value, nbytes)
+      self.size += nbytes
+      while self.size > self.max_bytes:
+        _, (_, evicted) = self.items.popitem(last=False)
+        self.size -= evicted
+    return True
+
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+      self.size = 0
+      self.hits = 0
+      self.misses = 0
@@ -5,11 +5,14 @@ import click
 from datetime import datetime
 from flask import current_app
 from flask.cli import with_appcontext
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import OperationalError, ProgrammingError, SQLAlchemyError, IntegrityError
 from werkzeug.security import generate_password_hash
 from .extensions import db
-from .models import User, Group, UserGroup, AbsenceType, Object, Holiday, VAbsence
+from .models import User, Group, UserGroup, AbsenceType, Object, Holiday, Absence, VAbsence
+from .bench import bench, bench_context
+from .segments import backfill_segments
+from .audit import run_audit
 
 def test_connection(database_url):
     engine = create_engine(database_url)
@@ -63,20 +66,49 @@ def create_postgres_db_helper():
     except OperationalError as e:
         click.echo(f"Error connecting to PostgreSQL: {e}")
 
-def init_db_helper():
-    wait_for_database()
+def get_view_sql():
     engine = db.get_engine()
     dialect = engine.dialect.name
 
     if dialect == "postgresql":
-        view_sql = os.path.join(current_app.root_path, 'sql/view_psql.sql')
+        return os.path.join(current_app.root_path, 'sql/view_psql.sql')
     elif dialect == "sqlite":
-        view_sql = os.path.join(current_app.root_path, 'sql/view_sqlite.sql')
+        return os.path.join(current_app.root_path, 'sql/view_sqlite.sql')
     else:
         raise ValueError(f"Unsupported database dialect: {dialect}")
+
+def create_view_helper(view_sql):
+    with open(view_sql, 'r') as file:
+        view_script = file.read()
+        view_statements = view_script.split(';')
+
+    for statement in view_statements:
+        if statement.strip():
+            try:
+                db.session.execute(text(statement))
+            except ProgrammingError as e:
+                current_app.logger.error(f"Failed to execute statement: {statement}")
+                current_app.logger.error(e)
+
+    db.session.commit()
+
+def init_db_helper():
+    wait_for_database()
+    view_sql = get_view_sql()
+    segments_exist = inspect(db.get_engine()).has_table('absence_segments')
     
     # Create all tables from model definitions
     db.create_all()
+    ensure_indexes_helper()
+
+    # Database created before absence_segments was introduced still uses recursive view,
+    # it is replaced even when there are no absences yet, segments are rebuilt when there are
+    if not segments_exist:
+        click.echo("Absence segments table created, recreating view")
+        recreate_view_helper(view_sql)
+        if Absence.query.first() is not None:
+            count = backfill_segments()
+            click.echo(f"Absence segments rebuilt. COUNT: {count}")
 
     # Try to query view capture exception if it doesn't exist
     # Create view if it doesn't exist
@@ -85,22 +117,35 @@ def init_db_helper():
     except Exception  as e:
         click.echo("View likely do not exists creating it")
         db.session.commit()
-        
-        with open(view_sql, 'r') as file:
-            view_script = file.read()
-            view_statements = view_script.split(';')
-
-        for statement in view_statements:
-            if statement.strip():
-                try:
-                    db.session.execute(text(statement))
-                except ProgrammingError as e:
-                    current_app.logger.error(f"Failed to execute statement: {statement}")
-                    current_app.logger.error(e)
-
-        db.session.commit()
+        create_view_helper(view_sql)
         click.echo("Tables and views created.")
 
+# Create indexes declared in models which are missing in existing tables
+# db.create_all() creates indexes only together with new tables
+def ensure_indexes_helper():
+    engine = db.get_engine()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# Drop v_absences and create it again from view_sql
+def recreate_view_helper(view_sql):
+    db.session.execute(text("DROP VIEW IF EXISTS v_absences"))
+    db.session.commit()
+    create_view_helper(view_sql)
+    click.echo("View v_absences recreated.")
+
+# Recreate v_absences on top of absence_segments and rebuild segments of all absences
+def backfill_segments_helper():
+    wait_for_database()
+    view_sql = get_view_sql()
+
+    db.create_all()
+    recreate_view_helper(view_sql)
+
+    count = backfill_segments()
+    click.echo(f"Absence segments rebuilt. COUNT: {count}")
+
 
 def populate_db_helper():
 
@@ -229,6 +274,23 @@ def drop_postgres_db():
 def init_db_command():
     init_db_helper()
 
+@click.command(name='backfill-segments', help="Rebuild absence_segments table and v_absences view")
+@with_appcontext
+def backfill_segments_command():
+    backfill_segments_helper()
+
+@click.command(name='db-audit', help="Print query plans and timings of calendar hot queries on synthetic data (rolled back)")
+@click.option('--objects', default=300, help="Number of synthetic objects")
+@click.option('--absences', default=20, help="Number of synthetic absences per object")
+@click.option('--repeat', default=20, help="Executions of every query used for timing")
+@with_appcontext
+def db_audit(objects, absences, repeat):
+    wait_for_database()
+    ensure_indexes_helper()
+    with bench_context():
+        for line in run_audit(objects, absences, repeat):
+            click.echo(line)
+
 @click.command(name='populate-db', help="Insert initial data into the database")
 @with_appcontext
 def populate_db():
@@ -275,7 +337,10 @@ def init_cli(app):
     app.cli.add_command(create_postgres_db)
     app.cli.add_command(drop_postgres_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(backfill_segments_command)
+    app.cli.add_command(db_audit)
     app.cli.add_command(reset_admin)
     app.cli.add_command(populate_db)
     app.cli.add_command(test_db_conn)
-    app.cli.add_command(setup_db)
\ No newline at end of file
+    app.cli.add_command(setup_db)
+    app.cli.add_command(bench)
\ No newline at end of file
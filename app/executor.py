@@ -0,0 +1,93 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+"""
+Optional process pool for encoding month images.
+Workers receive plain month layouts (layout.py) and encoder settings, never Flask
+or SQLAlchemy objects, and return encoded image bytes. Several months of a chunk
+are then encoded concurrently on all cores instead of one after another inside
+a sync gunicorn worker. RENDER_WORKERS = 0 keeps everything in the request process.
+A pool with a dead process is dropped, the chunk is encoded in the request process
+and the next chunk starts a new pool.
+"""
+
+# Prepare caches of pool process, it has no application
+def init_worker(options):
+  from .extensions import base_layers, row_strips
+  base_layers.resize(options['BASE_LAYER_CACHE_BYTES'])
+  row_strips.resize(options['ROW_STRIP_CACHE_BYTES'])
+
+# Import renderer and load fonts before the first request needs them
+def warm_up():
+  from .fonts import get_font
+  from .layout import FONT_SIZE, TITLE_FONT_SIZE
+  get_font(FONT_SIZE)
+  get_font(TITLE_FONT_SIZE)
+
+def encode_job(layout, fmt, options):
+  from .render import encode_month
+  return encode_month(layout, fmt, options)
+
+def encode_local(jobs):
+  from .render import encode_month
+  return [encode_month(layout, fmt) for layout, fmt in jobs]
+
+class RenderExecutor:
+  def __init__(self, app=None):
+    self.workers = 0
+    self.options = None
+    self.pool = None
+    self.pid = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    from .raster import render_options
+    self.workers = app.config.get('RENDER_WORKERS', 0)
+    self.options = render_options(app.config)
+
+  @property
+  def enabled(self):
+    return self.workers > 0
+
+  # Pool is started on first use in every gunicorn worker, a forked pool is not usable
+  def get_pool(self):
+    if self.pool is None or self.pid != os.getpid():
+      self.pool = ProcessPoolExecutor(
+        max_workers=self.workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        initargs=(self.options,)
+      )
+      self.pid = os.getpid()
+    return self.pool
+
+  # Start pool processes in the background, called from gunicorn post_worker_init hook
+  def start(self):
+    if self.enabled:
+      pool = self.get_pool()
+      for _ in range(self.workers):
+        pool.submit(warm_up)
+
+  # Drop pool, a new one is started by the next get_pool()
+  def reset(self):
+    if self.pool is not None and self.pid == os.getpid():
+      self.pool.shutdown(wait=False, cancel_futures=True)
+    self.pool = None
+
+  # Return encoded images of given [(layout, fmt)] in the same order
+  def encode(self, jobs):
+    if not self.enabled or len(jobs) < 2:
+      return encode_local(jobs)
+
+    try:
+      pool = self.get_pool()
+      futures = [pool.submit(encode_job, layout, fmt, self.options) for layout, fmt in jobs]
+      return [future.result() for future in futures]
+    except BrokenProcessPool as e:
+      current_app.logger.error(f"Render pool broken, encoding {len(jobs)} images in request process: {e}")
+      self.reset()
+      return encode_local(jobs)
@@ -3,6 +3,9 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_session import Session
+from .cache import RenderCache, LayerCache
+from .executor import RenderExecutor
+from .statements import StatementGuard
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -10,3 +13,8 @@ csrf = CSRFProtect()
 session = Session()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
+render_cache = RenderCache()
+base_layers = LayerCache()
+row_strips = LayerCache(size_key='ROW_STRIP_CACHE_BYTES')
+render_executor = RenderExecutor()
+statement_guard = StatementGuard()
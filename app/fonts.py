@@ -0,0 +1,89 @@
+import os
+import string
+from PIL import Image, ImageDraw, ImageFont
+
+"""
+Process wide font registry.
+Fonts are parsed once per worker and kept by (face, size). Advance widths of the
+glyphs used on calendar are measured once as well, so measuring text is a sum of
+dictionary lookups instead of a FreeType layout call.
+Rendered labels (day numbers, CW labels, object names, captions) are kept in a
+per font atlas of masks, so repeated text is pasted instead of rasterized again.
+"""
+
+TTF_DIR = os.path.join(os.path.dirname(__file__), 'static', 'ttf')
+DEFAULT_FACE = 'FiraCode-Regular'
+MASK_LIMIT = 4096       # Max number of rendered labels kept per font
+GLYPHS = string.ascii_letters + string.digits + string.punctuation + ' ' + 'ąćęłńóśźżĄĆĘŁŃÓŚŹŻäöüßÄÖÜ'
+
+class RegisteredFont:
+  def __init__(self, face, size):
+    self.face = face
+    self.size = size
+    self.font = ImageFont.truetype(os.path.join(TTF_DIR, f'{face}.ttf'), size)
+    self.advances = {glyph: self.font.getlength(glyph) for glyph in GLYPHS}
+
+    # FiraCode is fixed width, every glyph has the same advance
+    widths = set(self.advances.values())
+    self.advance = widths.pop() if len(widths) == 1 else None
+    self.masks = {}
+
+  # Return width of text in pixels, equals ImageDraw.textlength for this font
+  def textlength(self, text):
+    width = 0
+    for glyph in text:
+      advance = self.advances.get(glyph)
+      if advance is None:
+        advance = self.font.getlength(glyph)
+        self.advances[glyph] = advance
+      width += advance
+    return width
+
+  # Return longest prefix of text not wider than width
+  # Fixed width glyphs need no measuring, other text is shortened one character at a time
+  def fit(self, text, width):
+    if self.advance:
+      length = max(int(width // self.advance), 0)
+      prefix = text[:length]
+      if all(self.advances.get(glyph) == self.advance for glyph in prefix):
+        if length >= len(text) or self.advances.get(text[length]) == self.advance:
+          return prefix
+
+    text_width = self.textlength(text)
+    while text_width > width and len(text) > 0:
+      text = text[:-1]
+      text_width = self.textlength(text)
+    return text
+
+  # Return (mask, offset) of text rendered at given subpixel start, same as ImageDraw.text renders it
+  # mask is 'L' image to paste text color through
+  def mask(self, text, start=(0, 0)):
+    key = (text, start)
+    item = self.masks.get(key)
+    if item is None:
+      if len(self.masks) >= MASK_LIMIT:
+        self.masks.clear()
+      item = self.render_mask(text, start)
+      self.masks[key] = item
+    return item
+
+  # Draw text with ImageDraw on padded canvas and crop it to drawn pixels
+  # Pixels outside of the crop are zero in the mask, so pasting it changes the same pixels as ImageDraw.text
+  def render_mask(self, text, start):
+    pad = self.size
+    canvas = Image.new('L', (int(self.textlength(text)) + 3*pad, 3*pad))
+    ImageDraw.Draw(canvas).text((start[0] + pad, start[1] + pad), text, fill=255, font=self.font)
+    box = canvas.getbbox()
+    if box is None:
+      return Image.new('L', (0, 0)), (0, 0)
+    return canvas.crop(box), (box[0] - pad, box[1] - pad)
+
+_registry = {}
+
+def get_font(size, face=DEFAULT_FACE):
+  key = (face, size)
+  font = _registry.get(key)
+  if font is None:
+    font = RegisteredFont(face, size)
+    _registry[key] = font
+  return font
@@ -4,11 +4,13 @@ from wtforms import BooleanField
 from wtforms.validators import DataRequired, Length, EqualTo, Optional
 from wtforms.widgets import HiddenInput
 from wtforms.validators import ValidationError
-from flask import session, current_app
+from flask import current_app
 from flask_login import current_user
-from datetime import datetime
-from .models import User, Group, UserGroup, Absence, Object
+from sqlalchemy.orm import joinedload
+from .models import User, Group, Absence, Object
 from .extensions import db
+from . import refdata
+from .view import view_window, MAX_CHUNKSIZE, FIRST_MONTH, LAST_MONTH
 
 def no_whitespace(form, field):
     if any(char.isspace() for char in field.data):
@@ -28,23 +30,27 @@ def validate_group_exists(form, field):
     if group:
         raise ValidationError('Group with that name already exists')
 
+# Object chosen in absence form, loaded once for all validators and kept by the form
+# The session holds loaded objects weakly, so every db.session.get would query it again
+def chosen_object(form):
+    obj = getattr(form, 'chosen_object', None)
+    if obj is None or obj.id != form.object_id.data:
+        obj = db.session.get(Object, form.object_id.data)
+        form.chosen_object = obj
+    return obj
+
 # Validate if object someone is trying to modify absence belongs to any of the user's groups
 def validate_abs_group(form, field):
-    obj = db.session.get(Object, field.data)
-
-    user_groups = db.session.query(Group).join(UserGroup).filter(
-        UserGroup.user_id == current_user.id,
-        UserGroup.group_id == Group.id
-    ).distinct().all()
+    obj = chosen_object(form)
 
-    if obj.group_id not in [group.id for group in user_groups]:
+    if obj.group_id not in [group.id for group in refdata.user_groups(current_user.id)]:
         raise ValidationError('This object does not belong to any of your groups')
 
 # Validate if object owner is the current user attempting to modify the absence
 # Note: This validation is only applied if MODIFY_ALL_GROUP_ABSENCES is set to False
 def validate_abs_owner(form, field):
 
-    new_obj = db.session.get(Object, field.data)
+    new_obj = chosen_object(form)
     absence_id = form.id.data if 'id' in form else None
 
     if not current_app.config['MODIFY_ALL_GROUP_ABSENCES']:
@@ -52,7 +58,9 @@ def validate_abs_owner(form, field):
         if absence_id:
             # Check if the absence exists and get the original object
             # If current absence object owner is not the current user, raise an error not allowing the modification
-            absence = db.session.get(Absence, absence_id)
+            # Kept by the form, so the view gets the absence from the session without a query
+            absence = db.session.get(Absence, absence_id, options=[joinedload(Absence.object)])
+            form.chosen_absence = absence
             if absence.object.user_id != current_user.id:
                     raise ValidationError('You do not have permission to modify absence for this object')
         else:
@@ -61,17 +69,23 @@ def validate_abs_owner(form, field):
                 raise ValidationError('You do not have permission to create an absence for this object')
 
 
+# Validator of both dates, the overlap is queried once per form
 def validate_date_overlap(form, field):
-    query = db.session.query(Absence).filter(
-        Absence.object_id == form.object_id.data,
-        Absence.abs_date_start >= form.abs_date_start.data,
-        Absence.abs_date_end <= form.abs_date_end.data
-    )
+    overlap = getattr(form, 'dates_overlap', None)
+    if overlap is None:
+        query = db.session.query(Absence).filter(
+            Absence.object_id == form.object_id.data,
+            Absence.abs_date_start >= form.abs_date_start.data,
+            Absence.abs_date_end <= form.abs_date_end.data
+        )
 
-    # Edit mode - exclude current record from the query
-    query = query.filter(Absence.id != form.id.data)
+        # Edit mode - exclude current record from the query
+        query = query.filter(Absence.id != form.id.data)
 
-    if query.count() > 0:
+        overlap = query.count() > 0
+        form.dates_overlap = overlap
+
+    if overlap:
         raise ValidationError('Absence dates overlap with an existing record')
     
 class ObjectForm(FlaskForm):
@@ -87,13 +101,7 @@ class ObjectForm(FlaskForm):
 
     @classmethod
     def get_group_choices(cls):
-        with current_app.app_context():
-            groups = db.session.query(Group).join(UserGroup).filter(
-                UserGroup.user_id == current_user.id,
-                UserGroup.group_id == Group.id
-            ).distinct().all()
-            group_choices = [(g.id, g.name) for g in groups]
-            return group_choices
+        return refdata.group_choices(current_user.id)
         
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -123,10 +131,7 @@ class UserForm(FlaskForm):
 
     @classmethod
     def get_group_choices(cls):
-        with current_app.app_context():
-            groups = db.session.query(Group).all()
-            group_choices = [(g.id, g.name) for g in groups]
-            return group_choices
+        return refdata.group_choices()
         
     def __init__(self, *args, **kwargs):
         is_edit = kwargs.pop('is_edit', False)
@@ -234,24 +239,21 @@ class NavForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        chunksize = session.get("chunksize", 4)
-        start_month = session.get("start_month", datetime.today().month)
-        start_year = session.get("start_year", datetime.today().year)
-        group_id = session.get("group_id", 1)
+        # Window of the current page, the form is sent with GET to main.index
+        window = view_window()
+        chunksize = window.chunksize
+        start_month = window.start_month
+        start_year = window.start_year
+        group_id = window.group_id or 1
 
-        chunksize_choices = [(str(i), i) for i in range(1, 14)]
+        chunksize_choices = [(str(i), i) for i in range(1, MAX_CHUNKSIZE+1)]
         start_month_choices = [(str(i), i) for i in range(1, 13)]
-        start_year_choices = [(str(year), year) for year in range(start_year - 5, start_year + 6)]
-
-        user_groups = db.session.query(Group).join(UserGroup).filter(
-            UserGroup.user_id == current_user.id,
-            UserGroup.group_id == Group.id
-        ).distinct().all()
+        start_year_choices = [(str(year), year) for year in range(max(FIRST_MONTH[0], start_year - 5), min(LAST_MONTH[0], start_year + 5) + 1)]
 
         self.chunksize.choices = chunksize_choices
         self.start_month.choices = start_month_choices
         self.start_year.choices = start_year_choices
-        self.group_id.choices = [(group.id, group.name) for group in user_groups]
+        self.group_id.choices = refdata.group_choices(current_user.id)
 
         # Retrieve default values only if the form is not submitted
         if not self.is_submitted():
@@ -0,0 +1,213 @@
+import calendar
+from collections import namedtuple
+from datetime import date, datetime
+
+"""
+Month calendar layout.
+Pure geometry of month image computed from plain data, no Flask, no Pillow.
+Rasterizer (raster.py), image map generator (AbsMonth.gen_map) and any other
+output format consume the same layout, so callers that need only the image map
+skip drawing completely.
+
+Rows: 0 - CW header, 1 - day numbers, 2.. - objects
+Boxes are (x1, y1, x2, y2) tuples, points are (x, y) tuples.
+"""
+
+BACKGROUND = (192, 176, 192)
+WEEKEND = '#A090A0'
+GRID = '#808080'
+HOLIDAY = '#e121ff'
+PADDING = '#605060'
+CW = '#ba90ba'
+TEXT = '#000000'
+TITLE_CURRENT = '#2020FF'
+OUTLINE = '#ffffff'
+
+ROW_LABEL_WIDTH = 250
+COL_WIDTH = 25
+ROW_HEIGHT = 35
+HEADER_ROWS = 2
+FONT_SIZE = 13
+TITLE_FONT_SIZE = 20
+WIDTH = 1+ROW_LABEL_WIDTH+31*(COL_WIDTH+1)
+
+# Absence drawn on calendar
+# box - painted area, caption - description fitted into box, caption_xy - where caption starts
+Span = namedtuple('Span', ['absence_id', 'object_id', 'user_id', 'row', 'day', 'duration', 'color', 'description',
+                           'box', 'caption', 'caption_xy'])
+
+# Object row of calendar
+Row = namedtuple('Row', ['row', 'object_id', 'user_id', 'name', 'label_xy'])
+
+# Week number period in CW header, text_xy is None when period is too short for caption
+Period = namedtuple('Period', ['box', 'text', 'text_xy'])
+
+# Return box of given day in given row
+def cell_box(row, day):
+  x1=ROW_LABEL_WIDTH-COL_WIDTH+(day*COL_WIDTH)+day
+  y1=(row*ROW_HEIGHT)+row
+  x2=x1+COL_WIDTH-1
+  y2=y1+ROW_HEIGHT-1
+  return x1, y1, x2, y2
+
+class MonthLayout:
+  # objects - rows with id, user_id, object_name
+  # absences - rows with id, object_id, user_id, abs_date_start, abs_date_end, duration, description, at_color
+  # holidays - rows with event_date, description, fixed date holidays after recurring ones
+  # fit - function returning longest prefix of text not wider than given width in caption font
+  def __init__(self, year, month, objects, absences, holidays, fit, today=None):
+    self.year = year
+    self.month = month
+    self.today = today or date.today()
+    self.number_of_days = calendar.monthrange(year, month)[1]
+    self.is_current_month = (year == self.today.year and month == self.today.month)
+    self.items = len(objects)
+    self.width = WIDTH
+    self.height = (self.items+HEADER_ROWS)*(ROW_HEIGHT+1)
+    self.size = (self.width, self.height)
+
+    self.rows = self.layout_rows(objects)
+    self.object_rows = {row.object_id: row.row for row in self.rows}
+    self.weekends = self.layout_weekends()
+    self.vlines, self.hlines = self.layout_grid()
+    self.holidays, self.holiday_caption = self.layout_holidays(holidays)
+    self.day_numbers = self.layout_day_numbers()
+    self.padding = self.layout_padding()
+    self.periods = self.layout_periods()
+    self.title = self.layout_title()
+    self.outline = (0, 0, self.width, self.height) if self.is_current_month else None
+    self.spans, self.occupancy = self.layout_spans(absences, fit)
+    self.curday = self.layout_curday()
+
+  def layout_rows(self, objects):
+    rows = []
+    idx = 2 # Row two is first row with objects # Row 1 is header # Row 0 CW
+    for obj in objects:
+      rows.append(Row(idx, obj.id, obj.user_id, str(obj.object_name), (5, (idx*ROW_HEIGHT)+idx+7)))
+      idx += 1
+    return rows
+
+  # Saturday and Sunday columns
+  def layout_weekends(self):
+    boxes = []
+    for day in calendar.Calendar().itermonthdays4(self.year, self.month):
+      if day[1] == self.month and day[3] == 5:
+        end = 1 if day[2] + 1 > self.number_of_days else 2
+        first_day = day[2]
+        x1 = ROW_LABEL_WIDTH+(first_day-1)*COL_WIDTH+first_day
+        x2 = x1 + (end * COL_WIDTH) + end-2
+        boxes.append((x1, 1, x2, self.height-1))
+    return boxes
+
+  def layout_grid(self):
+    vlines = [(left_margin, 0, left_margin, self.height)
+              for left_margin in range(ROW_LABEL_WIDTH, self.width, COL_WIDTH+1)]
+    hlines = [(0, top_margin, self.width, top_margin)
+              for top_margin in range(HEADER_ROWS * ROW_HEIGHT + 1, self.height, ROW_HEIGHT+1)]
+    return vlines, hlines
+
+  # Holiday cells in day numbers row, later holiday of the same day overrides caption
+  def layout_holidays(self, holidays):
+    cells = []
+    captions = {}
+    for holiday in holidays:
+      day = holiday.event_date.day
+      x1=ROW_LABEL_WIDTH-COL_WIDTH+(day*COL_WIDTH)+day
+      y1=ROW_HEIGHT
+      cells.append((day, (x1, y1, x1+COL_WIDTH-1, y1+ROW_HEIGHT)))
+      captions[day] = holiday.description
+    return cells, captions
+
+  def layout_day_numbers(self):
+    return [((ROW_LABEL_WIDTH+(day-1)*(COL_WIDTH+1)+5, ROW_HEIGHT+5), str(day))
+            for day in range(1, self.number_of_days+1)]
+
+  # Grey area after last day when month has less than 31 days
+  def layout_padding(self):
+    padding = 31-self.number_of_days
+    if padding > 0:
+      return (self.width-COL_WIDTH * padding - padding, 0, self.width, self.height)
+    return None
+
+  """Build CW periods with information about first day of
+  week + day code, how many days left until saturday or end of current month
+  and number of current week"""
+  def layout_periods(self):
+    cwperiods = []
+    idx = 0
+    for day in calendar.Calendar().itermonthdays4(self.year, self.month):
+      if day[1] == self.month:
+        weekno = datetime(day[0], day[1], day[2]).isocalendar().week
+        if day[3] < 5 and idx == 0:
+          cwperiods.append((day, 5 - day[3], weekno))
+        elif day[3] == 0:
+          days_until_saturday = 5
+          if day[2] + days_until_saturday > self.number_of_days:
+            days_until_saturday = self.number_of_days+1 - day[2]
+          cwperiods.append((day, days_until_saturday, weekno))
+        idx += 1
+
+    periods = []
+    for day, end, weekno in cwperiods:
+      first_day = day[2]
+      x1 = ROW_LABEL_WIDTH+(first_day-1)*COL_WIDTH+first_day
+      y1 = 1
+      x2 = x1 + (end * COL_WIDTH) + end-2
+      y2 = ROW_HEIGHT-2
+      text_xy = None
+      # there must be at least two days in period to draw week number
+      if end > 1:
+        margin = (end*COL_WIDTH/2)-(COL_WIDTH-5)
+        text_xy = (x1+margin, y1+((y2-y1)/4))
+      periods.append(Period((x1, y1, x2, y2), 'CW ' + str(weekno), text_xy))
+    return periods
+
+  def layout_title(self):
+    text = date(self.year, self.month, 1).strftime('%B') + ' ' + str(self.year)
+    color = TITLE_CURRENT if self.is_current_month else TEXT
+    return (15, ROW_HEIGHT/2), text, color
+
+  # Absence boxes with fitted captions and day occupancy of every object {object_id: day bitmask}
+  def layout_spans(self, absences, fit):
+    spans = []
+    occupancy = {}
+    first_day = date(self.year, self.month, 1)
+    last_day = date(self.year, self.month, self.number_of_days)
+
+    for absence in absences:
+      start = max(absence.abs_date_start, first_day)
+      end = min(absence.abs_date_end, last_day)
+      if start <= end:
+        mask = occupancy.get(absence.object_id, 0)
+        for day in range(start.day, end.day+1):
+          mask |= 1 << day
+        occupancy[absence.object_id] = mask
+
+      row = self.object_rows.get(absence.object_id)
+      if row is None:
+        continue
+
+      day = absence.abs_date_start.day
+      duration = absence.duration
+      x1, y1, _, _ = cell_box(row, day)
+      x2 = x1+(COL_WIDTH*duration)+duration-2
+      y2 = y1+ROW_HEIGHT-1
+
+      caption = None
+      caption_xy = None
+      if absence.description:
+        caption = fit(absence.description, x2 - x1)
+        caption_xy = (x1, y1+(ROW_HEIGHT/4))
+
+      spans.append(Span(absence.id, absence.object_id, absence.user_id, row, day, duration, absence.at_color,
+                        absence.description, (x1, y1, x2, y2), caption, caption_xy))
+
+    return spans, occupancy
+
+  # White box around current day
+  def layout_curday(self):
+    if not self.is_current_month:
+      return None
+    x1 = ROW_LABEL_WIDTH-COL_WIDTH+(self.today.day*COL_WIDTH)+self.today.day
+    y1 = ROW_HEIGHT
+    return (x1, y1, x1+COL_WIDTH-1, y1+(ROW_HEIGHT*(self.items+1))+self.items)
@@ -1,26 +1,36 @@
-import os
 import random
-from PIL import Image, ImageDraw, ImageFont
-from .extensions import db
-from .models import AbsenceType
+from html import escape
+from PIL import Image, ImageDraw
+from .fonts import get_font
+from .raster import rgb
+from . import refdata, svg
+
+"""
+Legend of absence types. The geometry is computed once and drawn as PNG (get_image)
+or SVG (get_svg). Encoded legend is cached per absence types version (render.get_legend_image).
+"""
+
+HEIGHT = 30
 
 class Legend:
   def __init__(self, app_conf):
     self.app_conf = app_conf
     self.padding = 5
     self.img_color = (192, 176, 192)
-    self.ttf =  os.path.join(self.app_conf['ROOT_PATH'], "static/ttf","FiraCode-Regular.ttf")
-    self.font = ImageFont.truetype(self.ttf, 13)
+    self.metrics = get_font(13)
+    self.font = self.metrics.font
     self.elements = self.get_elements()
     self.elements_details = self.get_elements_details()
     self.img_width = self.calculate_width()
-    self.img_height = 30
+    self.img_height = HEIGHT
     self.img_size = (self.img_width, self.img_height)
-    self.image = Image.new("RGB", self.img_size, self.img_color)
-    self.draw = ImageDraw.Draw(self.image)
-    self.generate_image()
+    self.boxes = self.layout_boxes()
+    self.image = None
 
+  # Image is drawn on first use
   def get_image(self):
+    if self.image is None:
+      self.image = self.generate_image()
     return self.image
 
   def generate_random_color(self):
@@ -30,23 +40,19 @@ class Legend:
     return (r, g, b)
 
   def get_elements(self):
-    elements = db.session.query(AbsenceType).order_by(AbsenceType.id).all()
-    return elements
+    return refdata.absence_types()
 
   def get_elements_details(self):
     boxes = []
-    temp_img = Image.new("RGB", (1, 1), self.img_color)
-    temp_draw = ImageDraw.Draw(temp_img)
-    
     boxes.append({
       'caption': 'Legend:',
-      'text_width': temp_draw.textlength('Legend', font=self.font),
+      'text_width': self.metrics.textlength('Legend'),
     })
 
     for element in self.elements:
       caption = element.name
       background = element.color
-      text_width = temp_draw.textlength(caption, font=self.font)
+      text_width = self.metrics.textlength(caption)
       boxes.append({
         'caption': caption,
         'text_width': text_width,
@@ -60,7 +66,9 @@ class Legend:
       width += self.element['text_width']+3*self.padding
     return int(width)
 
-  def generate_image(self):
+  # Return [(box, caption, text_xy, background)], box and background are None for the 'Legend:' caption
+  def layout_boxes(self):
+    boxes = []
     x1 = self.padding
     y1 = self.padding
     x2 = 0
@@ -70,11 +78,33 @@ class Legend:
     for element in self.elements_details:
       x2 = x1 + element['text_width']+2*self.padding
       if element['caption'] == 'Legend:':
-        self.draw.text((x1, text_v_align), element['caption'], font=self.font, fill='#000000')
+        boxes.append((None, element['caption'], (x1, text_v_align), None))
       else:
-        self.draw.rectangle((x1, y1, x2, y2), fill=element.get('background', '#FFFFFF'))
-        self.draw.text((x1+self.padding, text_v_align), element['caption'], font=self.font, fill='#000000')
+        boxes.append(((x1, y1, x2, y2), element['caption'], (x1+self.padding, text_v_align), element.get('background', '#FFFFFF')))
       x1 = x2+self.padding
 
-    return self.image
+    return boxes
+
+  def generate_image(self):
+    image = Image.new("RGB", self.img_size, self.img_color)
+    draw = ImageDraw.Draw(image)
+    for box, caption, xy, background in self.boxes:
+      if box:
+        draw.rectangle(box, fill=rgb(background))
+      draw.text(xy, caption, font=self.font, fill=(0, 0, 0))
+    return image
 
+  # y - vertical position when the legend is nested in another SVG (see sheet.py)
+  def get_svg(self, y=None):
+    position = '' if y is None else f' y="{y}"'
+    items = [
+      f'<svg xmlns="http://www.w3.org/2000/svg"{position} width="{self.img_width}" height="{self.img_height}" '
+      f'viewBox="0 0 {self.img_width} {self.img_height}" font-family="{escape(svg.FONT_FAMILY)}" shape-rendering="crispEdges">',
+      f'<rect width="100%" height="100%" fill="{svg.color(self.img_color)}"/>'
+    ]
+    for box, caption, xy, background in self.boxes:
+      if box and background:
+        items.append(svg.rect(box, background))
+      items.append(svg.text(xy, caption, self.metrics, '#000000'))
+    items.append('</svg>')
+    return '\n'.join(items).encode()
@@ -0,0 +1,108 @@
+from datetime import date
+from flask import current_app
+from flask_login import current_user
+from .extensions import db
+from .models import Object, User, Group, Holiday, VAbsence
+
+"""
+Batched data loader for the calendar view.
+Fetches objects once, absences and holidays of the whole date window with one
+range query each, and hands per month slices to AbsMonth. A chunk of N months
+costs three queries instead of four per month.
+"""
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+# Return half-open date range [first day of month, first day of next month)
+def month_range(year, month):
+    return date(year, month, 1), date(*next_month(year, month), 1)
+
+# Whether objects and absences of other group members are hidden from current user
+def own_objects_only(app_conf):
+    return not app_conf['SHOW_ALL_GROUP_OBJECTS'] and not current_user.admin
+
+def objects_query(app_conf, group_id):
+    query = db.session.query(
+        Object.id,
+        Object.user_id,
+        Object.group_id,
+        User.username.label('owner'),
+        Group.name.label('group_name'),
+        Object.name.label('object_name'),
+        Object.description
+    ).join(Group, Object.group_id == Group.id, isouter=True)\
+    .join(User, Object.user_id == User.id, isouter=True)\
+    .filter(Object.group_id == group_id)
+
+    if own_objects_only(app_conf):
+        query = query.filter(Object.user_id == current_user.id)
+
+    return query
+
+# Absences starting in [start, end), absences are already split into months by v_absences
+def absences_query(app_conf, group_id, start, end):
+    query = VAbsence.query.filter(
+        VAbsence.group_id == group_id,
+        VAbsence.abs_date_start >= start,
+        VAbsence.abs_date_start < end
+    )
+
+    if own_objects_only(app_conf):
+        query = query.filter(VAbsence.user_id == current_user.id)
+
+    return query.order_by(VAbsence.id, VAbsence.abs_date_start)
+
+# Recurring holidays and fixed date holidays in [start, end)
+# UNION of two indexed lookups, OR of both conditions in one query scans the whole table
+def holidays_query(start, end):
+    recurring = db.session.query(Holiday).filter(Holiday.recurring == True)
+    fixed = db.session.query(Holiday).filter(Holiday.event_date >= start, Holiday.event_date < end)
+    return recurring.union(fixed)
+
+def load_objects(app_conf, group_id):
+    return objects_query(app_conf, group_id).all()
+
+def load_absences(app_conf, group_id, start, end):
+    return absences_query(app_conf, group_id, start, end).all()
+
+def load_holidays(start, end):
+    return holidays_query(start, end).all()
+
+# Return holidays of given month from load_holidays result
+# Recurring holidays first so fixed date holiday captions take precedence
+def month_holidays(holidays, year, month):
+    result = [h for h in holidays if h.recurring and h.event_date.month == month]
+    result += [h for h in holidays if not h.recurring and (h.event_date.year, h.event_date.month) == (year, month)]
+    return result
+
+# Return data of given months {(year, month): {'objects': [], 'absences': [], 'holidays': []}}
+# months - list of (year, month) tuples
+def load_months(app_conf, group_id, months):
+    if not months:
+        return {}
+
+    months = sorted(set(months))
+    start = date(*months[0], 1)
+    end = date(*next_month(*months[-1]), 1)
+
+    objects = load_objects(app_conf, group_id)
+    absences = load_absences(app_conf, group_id, start, end)
+    holidays = load_holidays(start, end)
+
+    slices = {}
+    for year, month in months:
+        slices[(year, month)] = {
+            'objects': objects,
+            'absences': [],
+            'holidays': month_holidays(holidays, year, month)
+        }
+
+    for absence in absences:
+        month_slice = slices.get((absence.abs_date_start.year, absence.abs_date_start.month))
+        if month_slice is not None:
+            month_slice['absences'].append(absence)
+
+    current_app.logger.info('Loaded months. COUNT: %s OBJECTS: %s ABSENCES: %s', len(months), len(objects), len(absences))
+
+    return slices
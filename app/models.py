@@ -11,7 +11,7 @@ class VAbsence(db.Model):
     group_id = db.Column(db.Integer)
     user_id = db.Column(db.Integer)
     type_id = db.Column(db.Integer)
-    abs_date_start = db.Column(db.Date)
+    abs_date_start = db.Column(db.Date, primary_key=True)     # Absence split into months has one row per month with the same id
     abs_date_end = db.Column(db.Date)
     duration = db.Column(db.Integer)
     description = db.Column(db.String)
@@ -69,7 +69,7 @@ class Object(db.Model):
     __tablename__ = 'objects'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
-    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'))
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), index=True)
     name = db.Column(db.String(30), unique=False, nullable=False)
     description = db.Column(db.String(255), nullable=True)
     absences = db.relationship('Absence', back_populates='object', cascade='all, delete-orphan')
@@ -97,6 +97,10 @@ class Absence(db.Model):
     description = db.Column(db.String(150))
     object = db.relationship('Object', back_populates='absences')
 
+    __table_args__ = (
+        db.Index('ix_absences_object_id_dates', 'object_id', 'abs_date_start', 'abs_date_end'),
+    )
+
     # Return ID of the user who owns the object the absence is related to
     def get_user_id(self):
         return self.object.user_id
@@ -105,15 +109,38 @@ class Absence(db.Model):
     def get_group_id(self):
         return self.object.group_id
 
+# Absences split into calendar months, maintained on every absence change (see segments.py)
+# v_absences reads from this table so month lookups use (group_id, abs_date_start) index
+class AbsenceSegment(db.Model):
+    __tablename__ = 'absence_segments'
+    absence_id = db.Column(db.Integer, db.ForeignKey('absences.id', ondelete='CASCADE'), primary_key=True)
+    abs_date_start = db.Column(db.Date, primary_key=True)
+    abs_date_end = db.Column(db.Date, nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    group_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_absence_segments_group_id_abs_date_start', 'group_id', 'abs_date_start'),
+        db.Index('ix_absence_segments_object_id', 'object_id'),
+    )
+
 class UserGroup(db.Model):
     __tablename__ = 'user_groups'
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True, index=True)
 
 class Holiday(db.Model):
     __tablename__ = 'holidays'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     country = db.Column(db.String(4), nullable=False)
-    event_date = db.Column(db.Date, nullable=False)
+    event_date = db.Column(db.Date, nullable=False, index=True)
     description = db.Column(db.String(150))
-    recurring = db.Column(db.Boolean, default=False)
+    recurring = db.Column(db.Boolean, default=False, index=True)
+
+# Data version counters used to invalidate render caches and HTTP validators
+# name: 'global', 'types', 'holidays', 'group:<group_id>' or 'month:<group_id>:<year>:<month>'
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
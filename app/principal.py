@@ -0,0 +1,55 @@
+from flask import current_app
+from flask_login import UserMixin
+from .extensions import db, render_cache
+from .models import User, UserGroup
+from .versions import get_versions, version_stamp, versions_pending
+from . import refdata
+
+"""
+Authenticated user principal.
+login_manager.user_loader runs on every request including every image fetch, so
+instead of the User row it returns a compact Principal (id, username, admin, group ids)
+kept in the shared render cache. Cached principal is tagged with the token of
+PRINCIPAL_KEYS counters the way refdata entries are, so any committed change of users,
+groups or memberships makes every worker load it again. PRINCIPAL_CACHE_TIMEOUT is
+only a backstop for changes made outside the application.
+"""
+
+PRINCIPAL_KEYS = ['global', 'groups', 'users']
+
+class Principal(UserMixin):
+    def __init__(self, id, username, admin, group_ids):
+        self.id = id
+        self.username = username
+        self.admin = admin
+        self.group_ids = group_ids
+
+    # Groups the user is a member of, (id, name) rows of refdata, deleted groups drop out right away
+    @property
+    def groups(self):
+        return [group for group in refdata.groups() if group.id in self.group_ids]
+
+    def __repr__(self):
+        return f"<Principal {self.username}>"
+
+def principal_key(user_id):
+    return f'principal:{user_id}'
+
+# Return Principal of given user id, None if the user does not exist
+def load_principal(user_id):
+    timeout = current_app.config['PRINCIPAL_CACHE_TIMEOUT']
+    # Reference data counters are read with the same query, refdata needs them later in the request
+    get_versions(list(dict.fromkeys(PRINCIPAL_KEYS + refdata.REFERENCE_KEYS)))
+    token = version_stamp(PRINCIPAL_KEYS).token
+    entry = render_cache.get(principal_key(user_id)) if timeout > 0 else None
+
+    if entry is None or entry[0] != token:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        group_ids = tuple(row.group_id for row in db.session.query(UserGroup.group_id).filter(UserGroup.user_id == user_id))
+        entry = (token, (user.id, user.username, user.admin, group_ids))
+        if timeout > 0 and not versions_pending(db.session):
+            render_cache.set(principal_key(user_id), entry, timeout=timeout)
+
+    return Principal(*entry[1])
@@ -0,0 +1,294 @@
+import functools
+import io
+import math
+import struct
+import zlib
+from flask import current_app
+from PIL import Image, ImageColor, ImageDraw
+from .extensions import base_layers, row_strips
+from .fonts import get_font
+from . import layout as lt
+
+"""
+PNG rasterizer of month layout (see layout.py).
+Image is composed of horizontal strips: header (CW and day number rows) and one
+strip per object row. Strips are cached in per worker LRUs by their content, so
+after one absence changes only its row is drawn again:
+- extensions.base_layers - header and empty object row of a month
+- extensions.row_strips - object rows with label and absences
+A row strip is width x STRIP_HEIGHT RGB pixels, about 114KB for a 31 day month, so
+ROW_STRIP_CACHE_BYTES has to hold rows x months of the viewed window to be reused
+(300 objects x 13 months is about 445MB). A smaller cache is walked cyclically and
+misses every row, which costs about the same as drawing all rows without a cache.
+
+PNG is written in palette mode. The calendar has only a few flat colors, the
+rest are antialiased text edges, which are mapped to ramps between text color and
+every background text is drawn on. Palette mode PNG is about half the size and
+encodes several times faster than RGB.
+
+Layouts taller than PNG_BAND_ROWS rows are rasterized and compressed in bands of
+that many rows (iter_png), so peak memory does not grow with the group size.
+"""
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+WEBP_MAX_SIZE = 16383     # Max WebP width and height
+
+TEXT_LEVELS = 16          # Antialiasing levels of text on every background, lowered when there are many absence types
+PALETTE_LIMIT = 64        # Max number of cached palettes
+
+# Paste text from font atlas, pixel identical to ImageDraw.text
+def paste_text(image, xy, text, metrics, color):
+  x, y = xy
+  mask, (dx, dy) = metrics.mask(text, (math.modf(x)[0], math.modf(y)[0]))
+  x, y = int(x)+dx, int(y)+dy
+  image.paste(rgb(color), (x, y, x+mask.width, y+mask.height), mask)
+
+# Box moved to coordinates of band starting at top
+def shift(box, top):
+  x1, y1, x2, y2 = box
+  return (x1, y1-top, x2, y2-top)
+
+# Whether vertical range [y1, y2] intersects band [top, bottom)
+def visible(y1, y2, top, bottom):
+  return y2 >= top and y1 < bottom
+
+# Text is never taller than a row
+def text_visible(xy, top, bottom):
+  return visible(xy[1], xy[1]+lt.ROW_HEIGHT, top, bottom)
+
+# Grid, weekends, day numbers, padding, CW header, title and current month outline
+# top, bottom - horizontal band of the image to draw, whole image by default
+def draw_base(layout, top=0, bottom=None):
+  bottom = layout.height if bottom is None else bottom
+  image = Image.new("RGB", (layout.width, bottom-top), lt.BACKGROUND)
+  draw = ImageDraw.Draw(image)
+  font = get_font(lt.FONT_SIZE)
+  title_font = get_font(lt.TITLE_FONT_SIZE)
+
+  for box in layout.weekends:
+    draw.rectangle(shift(box, top), fill=lt.WEEKEND)
+
+  for line in layout.vlines + layout.hlines:
+    if visible(line[1], line[3], top, bottom):
+      draw.line(shift(line, top), fill=lt.GRID, width=1)
+
+  for xy, text in layout.day_numbers:
+    if text_visible(xy, top, bottom):
+      paste_text(image, (xy[0], xy[1]-top), text, font, lt.TEXT)
+
+  if layout.padding:
+    draw.rectangle(shift(layout.padding, top), fill=lt.PADDING)
+
+  for period in layout.periods:
+    if visible(period.box[1], period.box[3], top, bottom):
+      draw.rectangle(shift(period.box, top), fill=lt.CW)
+      if period.text_xy:
+        paste_text(image, (period.text_xy[0], period.text_xy[1]-top), period.text, font, lt.TEXT)
+
+  xy, text, color = layout.title
+  if text_visible(xy, top, bottom):
+    paste_text(image, (xy[0], xy[1]-top), text, title_font, color)
+
+  if layout.outline:
+    draw.rectangle(shift(layout.outline, top), outline=lt.OUTLINE, width=2)
+
+  return image
+
+STRIP_HEIGHT = lt.ROW_HEIGHT+1
+HEADER_HEIGHT = lt.HEADER_ROWS*STRIP_HEIGHT
+
+# Strip pixels depend on the month, the current day box and whether the strip is the bottom one
+def strip_context(layout, bottom):
+  return (layout.year, layout.month, layout.today.day if layout.curday else None, bottom == layout.height)
+
+def header_strip(layout):
+  key = ('header', strip_context(layout, HEADER_HEIGHT), tuple(day for day, box in layout.holidays))
+  strip = base_layers.get(key)
+  if strip is not None:
+    return strip
+
+  strip = draw_base(layout, 0, HEADER_HEIGHT)
+  draw = ImageDraw.Draw(strip)
+  font = get_font(lt.FONT_SIZE)
+
+  # Holiday cell covers its day number, so the number is drawn again on top
+  for day, box in layout.holidays:
+    draw.rectangle(box, fill=lt.HOLIDAY)
+    xy, text = layout.day_numbers[day-1]
+    paste_text(strip, xy, text, font, lt.TEXT)
+
+  if layout.curday:
+    draw.rectangle(layout.curday, outline=lt.OUTLINE, width=2)
+
+  base_layers.set(key, strip, layout.width * HEADER_HEIGHT * 3)
+  return strip
+
+# Object row without label and absences, the same for every row but the bottom one
+def empty_row(layout, top):
+  key = ('row', strip_context(layout, top+STRIP_HEIGHT))
+  strip = base_layers.get(key)
+  if strip is None:
+    strip = draw_base(layout, top, top+STRIP_HEIGHT)
+    base_layers.set(key, strip, layout.width * STRIP_HEIGHT * 3)
+  return strip
+
+# spans - absences of the row in drawing order
+def row_strip(layout, row, spans):
+  top = row.row*STRIP_HEIGHT
+  context = strip_context(layout, top+STRIP_HEIGHT)
+  key = (context, row.name, tuple((span.day, span.duration, span.color, span.caption) for span in spans))
+  strip = row_strips.get(key)
+  if strip is not None:
+    return strip
+
+  strip = empty_row(layout, top).copy()
+  draw = ImageDraw.Draw(strip)
+  font = get_font(lt.FONT_SIZE)
+
+  paste_text(strip, (row.label_xy[0], row.label_xy[1]-top), row.name, font, lt.TEXT)
+
+  for span in spans:
+    draw.rectangle(shift(span.box, top), fill=rgb(span.color))
+    if span.caption_xy:
+      paste_text(strip, (span.caption_xy[0], span.caption_xy[1]-top), str(span.caption), font, lt.TEXT)
+
+  if layout.curday:
+    draw.rectangle(shift(layout.curday, top), outline=lt.OUTLINE, width=2)
+
+  row_strips.set(key, strip, layout.width * STRIP_HEIGHT * 3)
+  return strip
+
+# Return RGB image of layout, or of its band [top, bottom) when given
+# Band edges have to fall on row boundaries
+def rasterize(layout, top=0, bottom=None):
+  bottom = layout.height if bottom is None else bottom
+  image = Image.new("RGB", (layout.width, bottom-top), lt.BACKGROUND)
+
+  if top < HEADER_HEIGHT:
+    image.paste(header_strip(layout), (0, -top))
+
+  first = max(top // STRIP_HEIGHT, lt.HEADER_ROWS)
+  last = (bottom-1) // STRIP_HEIGHT
+  spans = {}
+  for span in layout.spans:
+    if first <= span.row <= last:
+      spans.setdefault(span.row, []).append(span)
+
+  for row in layout.rows[first-lt.HEADER_ROWS:last-lt.HEADER_ROWS+1]:
+    image.paste(row_strip(layout, row, spans.get(row.row, ())), (0, row.row*STRIP_HEIGHT-top))
+
+  return image
+
+_palettes = {}
+
+# Parsed color, shared by rasterizer, palettes and legend so every absence type color is parsed once per worker
+# None (absence type without color) stays None
+@functools.lru_cache(maxsize=1024)
+def rgb(color):
+  if color is None or isinstance(color, tuple):
+    return color
+  return ImageColor.getrgb(color)
+
+# Return colors from bg to fg excluding both ends
+def ramp(bg, fg, levels):
+  return [tuple(round(b+(f-b)*i/(levels-1)) for b, f in zip(bg, fg)) for i in range(1, levels-1)]
+
+# Return palette image for month with given absence type colors
+def month_palette(type_colors):
+  key = tuple(sorted(set(color for color in type_colors if color is not None)))
+  palette = _palettes.get(key)
+  if palette is not None:
+    return palette
+
+  types = [rgb(color) for color in key]
+  fixed = [rgb(color) for color in (lt.BACKGROUND, lt.WEEKEND, lt.GRID, lt.HOLIDAY, lt.PADDING, lt.CW,
+                                    lt.TEXT, lt.TITLE_CURRENT, lt.OUTLINE)]
+  text_backgrounds = [rgb(color) for color in (lt.BACKGROUND, lt.WEEKEND, lt.HOLIDAY, lt.CW)] + types
+  levels = min(TEXT_LEVELS, (256 - len(fixed) - len(types)) // (len(text_backgrounds) + 1) + 1)
+
+  colors = fixed + types
+  if levels > 2:
+    for background in text_backgrounds:
+      colors += ramp(background, rgb(lt.TEXT), levels)
+    colors += ramp(rgb(lt.BACKGROUND), rgb(lt.TITLE_CURRENT), levels)
+
+  palette = Image.new('P', (1, 1))
+  palette.putpalette([channel for color in colors[:256] for channel in color])
+  if len(_palettes) >= PALETTE_LIMIT:
+    _palettes.clear()
+  _palettes[key] = palette
+  return palette
+
+# Map RGB month image to month palette, every pixel gets the nearest palette color
+def to_palette(image, layout):
+  palette = month_palette([span.color for span in layout.spans])
+  return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+# Encoder settings read by functions below, outside of application context they are passed as plain dict
+RENDER_OPTIONS = ('PNG_PALETTE', 'PNG_COMPRESS_LEVEL', 'PNG_COMPRESS_TYPE', 'PNG_BAND_ROWS', 'WEBP_METHOD', 'WEBP_QUALITY',
+                  'BASE_LAYER_CACHE_BYTES', 'ROW_STRIP_CACHE_BYTES')
+
+def render_options(config):
+  return {key: config[key] for key in RENDER_OPTIONS}
+
+# layout - convert image to palette mode of this layout, RGB is kept if None or PNG_PALETTE is False
+# options - encoder settings, application config by default
+def encode_png(image, layout=None, options=None):
+  config = options or current_app.config
+  if layout is not None and config['PNG_PALETTE']:
+    image = to_palette(image, layout)
+
+  buffer = io.BytesIO()
+  image.save(buffer, 'PNG', compress_level=config['PNG_COMPRESS_LEVEL'], compress_type=config['PNG_COMPRESS_TYPE'])
+  return buffer.getvalue()
+
+# Whether layout is rendered in bands instead of one image
+def banded(layout, options=None):
+  band_rows = (options or current_app.config)['PNG_BAND_ROWS']
+  return bool(band_rows) and layout.items + lt.HEADER_ROWS > band_rows
+
+def png_chunk(kind, data):
+  return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+# Yield PNG of layout in chunks, rasterizing PNG_BAND_ROWS rows at a time
+def iter_png(layout, options=None):
+  config = options or current_app.config
+  band_height = config['PNG_BAND_ROWS'] * STRIP_HEIGHT
+  palette = month_palette([span.color for span in layout.spans]) if config['PNG_PALETTE'] else None
+  bands = (rasterize(layout, top, min(top+band_height, layout.height)) for top in range(0, layout.height, band_height))
+  return write_png(layout.width, layout.height, bands, palette, options)
+
+# Yield PNG of given size in chunks
+# bands - RGB images of full width from top to bottom, each is compressed and dropped before the next one is drawn
+# palette - palette image bands are mapped to, RGB PNG if None
+# Scanlines are written unfiltered, the same as Pillow does for palette images
+def write_png(width, height, bands, palette, options=None):
+  config = options or current_app.config
+  header = struct.pack('>IIBBBBB', width, height, 8, 3 if palette else 2, 0, 0, 0)
+  yield PNG_SIGNATURE + png_chunk(b'IHDR', header)
+  if palette:
+    yield png_chunk(b'PLTE', bytes(palette.getpalette()))
+
+  compressor = zlib.compressobj(config['PNG_COMPRESS_LEVEL'], zlib.DEFLATED, zlib.MAX_WBITS, 9, config['PNG_COMPRESS_TYPE'])
+  stride = width * (1 if palette else 3)
+  for band in bands:
+    if palette:
+      band = band.quantize(palette=palette, dither=Image.Dither.NONE)
+    pixels = band.tobytes()
+    data = compressor.compress(b''.join(b'\x00' + pixels[i:i+stride] for i in range(0, len(pixels), stride)))
+    if data:
+      yield png_chunk(b'IDAT', data)
+
+  yield png_chunk(b'IDAT', compressor.flush()) + png_chunk(b'IEND', b'')
+
+# WebP is encoded from one whole RGB image, so images that PNG encodes in bands are never WebP
+def webp_fits(height, options=None):
+  band_rows = (options or current_app.config)['PNG_BAND_ROWS']
+  return height <= WEBP_MAX_SIZE and not (band_rows and height > band_rows * STRIP_HEIGHT)
+
+# Lossless WebP, WEBP_METHOD and WEBP_QUALITY trade encode time for size
+def encode_webp(image, options=None):
+  config = options or current_app.config
+  buffer = io.BytesIO()
+  image.save(buffer, 'WEBP', lossless=True, method=config['WEBP_METHOD'], quality=config['WEBP_QUALITY'])
+  return buffer.getvalue()
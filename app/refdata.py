@@ -0,0 +1,96 @@
+from collections import namedtuple
+from threading import Lock
+from flask import has_request_context
+from flask_login import current_user
+from .extensions import db
+from .models import AbsenceType, Group, UserGroup, Object
+from .versions import version_stamp, versions_pending
+
+"""
+Per worker cache of reference data: absence types, groups, group members and objects.
+They change rarely but form choices and the navigation form read them on every request.
+Entries are plain tuples tagged with the token of REFERENCE_KEYS counters, the counters
+are read with one query per request (memoized with the month counters, see versions.py),
+so any committed change in any worker makes every worker load the data again.
+"""
+
+REFERENCE_KEYS = ['global', 'types', 'groups']
+ENTRY_LIMIT = 1024          # Max number of cached entries, per user and per group entries included
+
+TypeRow = namedtuple('TypeRow', ['id', 'name', 'color'])
+GroupRow = namedtuple('GroupRow', ['id', 'name'])
+ObjectRow = namedtuple('ObjectRow', ['id', 'name', 'user_id', 'group_id'])
+
+_entries = {}
+_lock = Lock()
+
+# Return value of entry, load() is called when the entry is missing or reference data changed
+# Values loaded in a transaction with uncommitted changes are not stored, they may be rolled back
+def cached(name, load):
+    token = version_stamp(REFERENCE_KEYS).token
+    entry = _entries.get(name)
+    if entry is not None and entry[0] == token:
+        return entry[1]
+
+    value = load()
+    if versions_pending(db.session):
+        return value
+    with _lock:
+        if len(_entries) >= ENTRY_LIMIT:
+            _entries.clear()
+        _entries[name] = (token, value)
+    return value
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def absence_types():
+    return cached('types', lambda: tuple(
+        TypeRow(row.id, row.name, row.color)
+        for row in db.session.query(AbsenceType.id, AbsenceType.name, AbsenceType.color).order_by(AbsenceType.id)
+    ))
+
+def groups():
+    return cached('groups', lambda: tuple(
+        GroupRow(row.id, row.name) for row in db.session.query(Group.id, Group.name).order_by(Group.id)
+    ))
+
+# Groups the user is a member of, memberships of the logged in user come with its principal
+def user_groups(user_id):
+    if has_request_context() and current_user.is_authenticated and current_user.id == user_id:
+        return tuple(current_user.groups)
+
+    def load():
+        group_ids = {row.group_id for row in db.session.query(UserGroup.group_id).filter(UserGroup.user_id == user_id)}
+        return tuple(group for group in groups() if group.id in group_ids)
+    return cached(f'user_groups:{user_id}', load)
+
+# Objects of the groups the user is a member of ((group, objects), ...), one query for all groups
+def user_objects(user_id):
+    def load():
+        member_groups = user_groups(user_id)
+        objects = {group.id: [] for group in member_groups}
+        for row in db.session.query(Object.id, Object.name, Object.user_id, Object.group_id)\
+                .filter(Object.group_id.in_(list(objects))).order_by(Object.id):
+            objects[row.group_id].append(ObjectRow(row.id, row.name, row.user_id, row.group_id))
+        return tuple((group, tuple(objects[group.id])) for group in member_groups)
+    return cached(f'user_objects:{user_id}', load)
+
+# Form choices
+
+def type_choices():
+    return [(str(row.id), row.name) for row in absence_types()]
+
+def group_choices(user_id=None):
+    rows = groups() if user_id is None else user_groups(user_id)
+    return [(group.id, group.name) for group in rows]
+
+# Objects of user's groups, only user's own objects unless SHOW_ALL_GROUP_OBJECTS
+def object_choices(app_conf, user):
+    choices = []
+    for group, objects in user_objects(user.id):
+        for obj in objects:
+            if app_conf['SHOW_ALL_GROUP_OBJECTS'] or obj.user_id == user.id:
+                choices.append((str(obj.id), group.name + " " + obj.name))
+    return choices
@@ -0,0 +1,263 @@
+import hashlib
+from datetime import date, datetime
+from flask import request
+from flask_login import current_user
+from .extensions import render_cache, render_executor
+from .image import AbsMonth
+from .legend import Legend
+from . import raster, sheet, svg
+from .loader import load_months
+from .versions import month_version
+from .view import view_group_id
+
+"""
+Shared month render artifacts.
+main.index needs the image map and month.month needs the PNG of the very same
+AbsMonth, so both read one artifact instead of building the month twice:
+{png, webp, svg, layout, img_map, click_map, group_id, year, month, scope, version, last_modified, width, height, rendered_at}
+Artifacts are keyed by data version so any change of the month data makes a new key.
+main.index stores map-only artifacts (no image), every image format is encoded from
+the stored layout when the browser requests it and added to the artifact.
+PNG of large groups is streamed to the browser band by band while it is encoded.
+"""
+
+RENDER_FORMAT = 1   # Part of every render key, bump when drawing of months or legend changes
+
+IMAGE_FORMATS = {
+  'png': 'image/png',
+  'webp': 'image/webp',
+  'svg': 'image/svg+xml'
+}
+
+# Return image format requested with ?fmt= or negotiated from Accept header, PNG by default
+# Browsers list image/webp next to image/* with the same quality, so WebP and SVG are
+# only served when the client ranks them strictly higher than PNG (IMAGE_FORMATS order wins ties)
+def image_format():
+  fmt = request.args.get('fmt')
+  if fmt in IMAGE_FORMATS:
+    return fmt
+
+  accept = request.accept_mimetypes
+  return max(IMAGE_FORMATS, key=lambda fmt: accept.quality(IMAGE_FORMATS[fmt]))
+
+# WebP is limited in height and has no banded encoder, months too tall for it are served as PNG
+def served_format(artifact, fmt):
+  if fmt == 'webp' and not raster.webp_fits(artifact['height']):
+    return 'png'
+  return fmt
+
+# Visibility scope of rendered month
+# 'all' - every object and every absence is visible and editable (admin, or SHOW_ALL_GROUP_OBJECTS with MODIFY_ALL_GROUP_ABSENCES)
+# 'user:<id>' - objects or image map links depend on the user
+def render_scope(app_conf, user):
+  if user.admin:
+    return 'all'
+  if app_conf['SHOW_ALL_GROUP_OBJECTS'] and app_conf['MODIFY_ALL_GROUP_ABSENCES']:
+    return 'all'
+  return f'user:{user.id}'
+
+# Only the current month depends on today's date (current day box)
+def today_marker(year, month):
+  today = date.today()
+  if year == today.year and month == today.month:
+    return today.isoformat()
+  return '-'
+
+def render_key(group_id, year, month, scope, version):
+  return f'month:{RENDER_FORMAT}:{group_id}:{year}:{month}:{scope}:{version.token}:{today_marker(year, month)}'
+
+# Return month image of given format (see IMAGE_FORMATS) encoded from layout
+# options - encoder settings (raster.render_options), application config by default
+def encode_month(layout, fmt, options=None):
+  if fmt == 'svg':
+    return svg.render_svg(layout)
+
+  if fmt == 'png' and raster.banded(layout, options):
+    return b''.join(raster.iter_png(layout, options))
+
+  image = raster.rasterize(layout)
+  if fmt == 'webp':
+    return raster.encode_webp(image, options)
+  return raster.encode_png(image, layout, options)
+
+# data - {'objects', 'absences', 'holidays'} slice from loader.load_months, fetched by AbsMonth if None
+# fmt - image format to encode right away, None builds layout and image map only
+def render_month(app_conf, year, month, group_id, scope, version, data=None, fmt='png'):
+  abs_month = AbsMonth(app_conf, year, month, group_id=group_id, **(data or {}))
+  artifact = {
+    'png': None,
+    'webp': None,
+    'svg': None,
+    'layout': abs_month.layout,
+    'img_map': abs_month.img_map,
+    'click_map': abs_month.click_map,
+    'group_id': group_id,
+    'year': abs_month.year,
+    'month': abs_month.month,
+    'scope': scope,
+    'version': version.token,
+    'last_modified': version.last_modified,
+    'width': abs_month.img_width,
+    'height': abs_month.img_height,
+    'rendered_at': datetime.now()
+  }
+  if fmt:
+    artifact[fmt] = encode_month(abs_month.layout, fmt)
+  return artifact
+
+# Strong validator of month image, changes with any input of the render key and with image format
+def render_etag(key, fmt='png'):
+  return hashlib.sha1(f'{key}:{fmt}'.encode()).hexdigest()
+
+# Return everything that identifies render of given month for the current user
+# {group_id, year, month, scope, version, key} - no rendering involved
+def month_render_info(app_conf, year=None, month=None):
+  today = date.today()
+  year = year or today.year
+  month = month or today.month
+  group_id = view_group_id()
+  scope = render_scope(app_conf, current_user)
+  version = month_version(group_id, year, month)
+  key = render_key(group_id, year, month, scope, version)
+  return {
+    'group_id': group_id,
+    'year': year,
+    'month': month,
+    'scope': scope,
+    'version': version,
+    'key': key
+  }
+
+# Return render artifact for given month, render and store it if not cached
+# refresh - ignore cached artifact and render again
+# fmt - image format the artifact has to contain, None is enough for callers that need the image map only
+def get_month_render(app_conf, year=None, month=None, refresh=False, info=None, data=None, fmt='png'):
+  info = info or month_render_info(app_conf, year, month)
+
+  artifact = None if refresh else render_cache.get(info['key'])
+  if artifact is None:
+    artifact = render_month(app_conf, info['year'], info['month'], info['group_id'], info['scope'], info['version'], data, fmt)
+    render_cache.set(info['key'], artifact)
+  elif fmt and artifact.get(fmt) is None:
+    artifact = add_image(info['key'], artifact, fmt)
+
+  return artifact
+
+# Add image of given format to cached artifact and store it back
+def add_image(key, artifact, fmt):
+  artifact = dict(artifact, **{fmt: encode_month(artifact['layout'], fmt)})
+  render_cache.set(key, artifact)
+  return artifact
+
+# Return (fmt, artifact) - image format served for the requested one, and month artifact when it was needed to decide
+# Only WebP depends on the month height, other formats are resolved without reading the artifact
+def month_image_format(app_conf, info, fmt):
+  if fmt != 'webp':
+    return fmt, None
+  artifact = get_month_render(app_conf, info=info, fmt=None)
+  return served_format(artifact, fmt), artifact
+
+# Return month image of served format (see month_image_format) for the current user
+# body is bytes, or iterator of PNG chunks when the image is rendered in bands, it is cached after the last chunk
+def get_month_image(app_conf, info, fmt, artifact=None):
+  artifact = artifact or get_month_render(app_conf, info=info, fmt=None)
+
+  if artifact.get(fmt) is not None:
+    return artifact[fmt]
+  if fmt == 'png' and raster.banded(artifact['layout']):
+    return stream_png(info['key'], artifact)
+  return add_image(info['key'], artifact, fmt)[fmt]
+
+def stream_png(key, artifact):
+  chunks = []
+  for chunk in raster.iter_png(artifact['layout']):
+    chunks.append(chunk)
+    yield chunk
+  render_cache.set(key, dict(artifact, png=b''.join(chunks)))
+
+# Return render artifacts of given months in the same order, missing ones are rendered without image
+# Data of all months missing in cache is fetched with one batch of queries
+# fmt - also encode images of this format missing in artifacts, concurrently when render executor is enabled
+def get_month_renders(app_conf, months, fmt=None):
+  infos = [month_render_info(app_conf, year, month) for year, month in months]
+
+  artifacts = {info['key']: render_cache.get(info['key']) for info in infos}
+  missing = [(info['year'], info['month']) for info in infos if artifacts[info['key']] is None]
+
+  if missing:
+    slices = load_months(app_conf, view_group_id(), missing)
+    for info in infos:
+      if artifacts[info['key']] is None:
+        artifacts[info['key']] = get_month_render(app_conf, refresh=True, info=info, data=slices[(info['year'], info['month'])], fmt=None)
+
+  if fmt:
+    add_images(infos, artifacts, fmt)
+
+  return [artifacts[info['key']] for info in infos]
+
+# Encode images missing in artifacts {key: artifact} with render executor and store artifacts back
+def add_images(infos, artifacts, fmt):
+  missing = []
+  for info in infos:
+    artifact = artifacts[info['key']]
+    served = served_format(artifact, fmt)
+    if artifact.get(served) is None:
+      missing.append((info['key'], served))
+
+  bodies = render_executor.encode([(artifacts[key]['layout'], served) for key, served in missing])
+  for (key, served), body in zip(missing, bodies):
+    artifacts[key] = dict(artifacts[key], **{served: body})
+    render_cache.set(key, artifacts[key])
+
+# Counters start again after a database reset, so the time of the last change of types is part of the key
+def legend_key(types, fmt):
+  return f'legend:{RENDER_FORMAT}:{types.token}:{types.last_modified}:{fmt}'
+
+# Strong validator of legend image, changes with absence types and with image format
+def legend_etag(types, fmt='png'):
+  return hashlib.sha1(legend_key(types, fmt).encode()).hexdigest()
+
+# Return legend image of given format, rendered once per absence types version
+# types - types_version(), the image expires like month images
+def get_legend_image(app_conf, types, fmt='png'):
+  key = legend_key(types, fmt)
+  body = render_cache.get(key)
+  if body is None:
+    body = encode_legend(Legend(app_conf), fmt)
+    render_cache.set(key, body)
+  return body
+
+def encode_legend(legend, fmt, options=None):
+  if fmt == 'svg':
+    return legend.get_svg()
+  if fmt == 'webp':
+    return raster.encode_webp(legend.get_image(), options)
+  return raster.encode_png(legend.get_image(), options=options)
+
+# Strong validator of sprite sheet of given months (see sheet.py)
+# infos - month_render_info of every month, types - version of absence types drawn in legend
+def sheet_etag(infos, types, fmt='png'):
+  keys = ','.join(info['key'] for info in infos)
+  return hashlib.sha1(f'sheet:{keys}:{legend_key(types, fmt)}'.encode()).hexdigest()
+
+# Return (fmt, body) of sprite sheet of given months, cached under its etag
+# body is bytes, or iterator of PNG chunks which is cached after the last chunk
+def get_sheet_image(app_conf, months, etag, fmt):
+  key = f'sheet:{etag}'
+  cached = render_cache.get(key)
+  if cached is not None:
+    return cached
+
+  layouts = [artifact['layout'] for artifact in get_month_renders(app_conf, months)]
+  fmt, body = sheet.encode_sheet(Legend(app_conf), layouts, fmt)
+  if isinstance(body, bytes):
+    render_cache.set(key, (fmt, body))
+    return fmt, body
+  return fmt, stream_sheet(key, fmt, body)
+
+def stream_sheet(key, fmt, body):
+  chunks = []
+  for chunk in body:
+    chunks.append(chunk)
+    yield chunk
+  render_cache.set(key, (fmt, b''.join(chunks)))
@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+from sqlalchemy import event, inspect, select, delete, insert, update
+from .extensions import db
+from .models import Absence, AbsenceSegment, Object
+
+"""
+Maintenance of absence_segments table.
+Every absence is stored as one segment per calendar month it covers, so the
+calendar reads a month with an indexed (group_id, abs_date_start) range lookup
+instead of expanding the whole absences table with a recursive view.
+"""
+
+# Split date range into (start, end) pieces, one per calendar month
+def split_months(start, end):
+    segments = []
+    while start <= end:
+        next_month = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+        segment_end = min(end, next_month - timedelta(days=1))
+        segments.append((start, segment_end))
+        start = next_month
+    return segments
+
+def segment_rows(absence_id, object_id, group_id, start, end):
+    return [{
+        'absence_id': absence_id,
+        'object_id': object_id,
+        'group_id': group_id,
+        'abs_date_start': segment_start,
+        'abs_date_end': segment_end
+    } for segment_start, segment_end in split_months(start, end)]
+
+# Group of the absence object, taken from the object when the absence has it loaded
+def object_group_id(connection, absence):
+    if 'object' not in inspect(absence).unloaded and absence.object is not None and absence.object.id == absence.object_id:
+        return absence.object.group_id
+    return connection.execute(
+        select(Object.__table__.c.group_id).where(Object.__table__.c.id == absence.object_id)
+    ).scalar()
+
+def write_segments(connection, absence):
+    table = AbsenceSegment.__table__
+    connection.execute(delete(table).where(table.c.absence_id == absence.id))
+
+    group_id = object_group_id(connection, absence)
+
+    rows = segment_rows(absence.id, absence.object_id, group_id, absence.abs_date_start, absence.abs_date_end)
+    if rows:
+        connection.execute(insert(table), rows)
+
+@event.listens_for(Absence, 'after_insert')
+def absence_inserted(mapper, connection, absence):
+    write_segments(connection, absence)
+
+@event.listens_for(Absence, 'after_update')
+def absence_updated(mapper, connection, absence):
+    write_segments(connection, absence)
+
+@event.listens_for(Absence, 'after_delete')
+def absence_deleted(mapper, connection, absence):
+    table = AbsenceSegment.__table__
+    connection.execute(delete(table).where(table.c.absence_id == absence.id))
+
+# Segments carry group of the object so they have to follow the object to another group
+@event.listens_for(Object, 'after_update')
+def object_updated(mapper, connection, obj):
+    history = inspect(obj).attrs.group_id.history
+    if history.has_changes():
+        table = AbsenceSegment.__table__
+        connection.execute(update(table).where(table.c.object_id == obj.id).values(group_id=obj.group_id))
+
+# Rebuild all segments from absences table, return number of segments written
+def backfill_segments(batch_size=1000):
+    table = AbsenceSegment.__table__
+    db.session.execute(delete(table))
+
+    query = db.session.query(
+        Absence.id,
+        Absence.object_id,
+        Object.group_id,
+        Absence.abs_date_start,
+        Absence.abs_date_end
+    ).outerjoin(Object, Absence.object_id == Object.id).order_by(Absence.id)
+
+    count = 0
+    rows = []
+    for absence in query.all():
+        rows.extend(segment_rows(absence.id, absence.object_id, absence.group_id, absence.abs_date_start, absence.abs_date_end))
+        if len(rows) >= batch_size:
+            db.session.execute(insert(table), rows)
+            count += len(rows)
+            rows = []
+
+    if rows:
+        db.session.execute(insert(table), rows)
+        count += len(rows)
+
+    db.session.commit()
+    return count
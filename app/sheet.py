@@ -0,0 +1,116 @@
+import re
+from flask import current_app
+from PIL import Image
+from . import legend as lg
+from . import raster, svg
+
+"""
+Sprite sheet of the visible chunk: legend and month images stacked top to bottom
+in one image, so a page view costs the page and one image request.
+Parts are separated by SHEET_GAP pixels of page background. The image maps of the
+months are merged into one map with coordinates moved by the top of every month,
+click maps get top and height of their month (static/calendar.js).
+Months are rasterized in bands from the same cached strips as single month images.
+"""
+
+SHEET_GAP = 16              # Pixels between legend and months
+PAGE_BACKGROUND = '#acacac' # Body background of style.css
+MAP_NAME = 'sheet'
+
+COORDS = re.compile(r'coords="(\d+),(\d+),(\d+),(\d+)"')
+
+# Return top of every part and height of the sheet, parts are legend and months of given heights
+def sheet_tops(heights):
+  tops = []
+  top = 0
+  for height in [lg.HEIGHT] + list(heights):
+    tops.append(top)
+    top += height + SHEET_GAP
+  return tops, top - SHEET_GAP
+
+# Return <area> entry moved down by top pixels
+def shift_area(area, top):
+  return COORDS.sub(lambda m: f'coords="{m[1]},{int(m[2])+top},{m[3]},{int(m[4])+top}"', area)
+
+# Return (img_map, click_maps) of sheet from month render artifacts
+def sheet_maps(artifacts):
+  tops, _ = sheet_tops(artifact['height'] for artifact in artifacts)
+  img_map = [f'<map name="{MAP_NAME}">']
+  click_maps = []
+  for top, artifact in zip(tops[1:], artifacts):
+    # First and last entries of month map are <map> tags
+    img_map += [shift_area(area, top) for area in artifact['img_map'][1:-1]]
+    click_maps.append(dict(artifact['click_map'], top=top, height=artifact['height']))
+  img_map.append('</map>')
+  return img_map, click_maps
+
+# Return image padded with page background to given width
+def pad(image, width):
+  if image.width == width:
+    return image
+  padded = Image.new('RGB', (width, image.height), raster.rgb(PAGE_BACKGROUND))
+  padded.paste(image, (0, 0))
+  return padded
+
+# Yield RGB bands of the sheet from top to bottom
+# legend - legend.Legend, layouts - month layouts
+def iter_bands(legend, layouts, width, options=None):
+  band_height = (options or current_app.config)['PNG_BAND_ROWS'] * raster.STRIP_HEIGHT
+  gap = Image.new('RGB', (width, SHEET_GAP), raster.rgb(PAGE_BACKGROUND))
+
+  yield pad(legend.get_image(), width)
+  for layout in layouts:
+    yield gap
+    step = band_height or layout.height
+    for top in range(0, layout.height, step):
+      yield pad(raster.rasterize(layout, top, min(top+step, layout.height)), width)
+
+def sheet_size(legend, layouts):
+  _, height = sheet_tops(layout.height for layout in layouts)
+  return max([legend.img_width] + [layout.width for layout in layouts]), height
+
+# Palette of all months, legend boxes and page background, which is counted as one more absence type
+def sheet_palette(legend, layouts):
+  colors = [span.color for layout in layouts for span in layout.spans]
+  colors += [element.color for element in legend.elements]
+  return raster.month_palette(colors + [PAGE_BACKGROUND])
+
+# Yield PNG of sheet in chunks, band by band
+def iter_sheet_png(legend, layouts, options=None):
+  config = options or current_app.config
+  width, height = sheet_size(legend, layouts)
+  palette = sheet_palette(legend, layouts) if config['PNG_PALETTE'] else None
+  return raster.write_png(width, height, iter_bands(legend, layouts, width, options), palette, options)
+
+# Whole sheet as one RGB image
+def rasterize_sheet(legend, layouts, options=None):
+  width, height = sheet_size(legend, layouts)
+  image = Image.new('RGB', (width, height), raster.rgb(PAGE_BACKGROUND))
+  top = 0
+  for band in iter_bands(legend, layouts, width, options):
+    image.paste(band, (0, top))
+    top += band.height
+  return image
+
+# Legend and months are nested SVGs
+def render_sheet_svg(legend, layouts):
+  width, height = sheet_size(legend, layouts)
+  tops, _ = sheet_tops(layout.height for layout in layouts)
+
+  items = [
+    f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+    f'<rect width="100%" height="100%" fill="{PAGE_BACKGROUND}"/>',
+    legend.get_svg().decode()
+  ]
+  items += [svg.render_svg(layout, top).decode() for top, layout in zip(tops[1:], layouts)]
+  items.append('</svg>')
+  return '\n'.join(items).encode()
+
+# Return (fmt, body) of sheet, body is iterator of chunks for PNG
+# Sheets too tall for WebP (raster.webp_fits) are served as PNG
+def encode_sheet(legend, layouts, fmt, options=None):
+  if fmt == 'svg':
+    return fmt, render_sheet_svg(legend, layouts)
+  if fmt == 'webp' and raster.webp_fits(sheet_size(legend, layouts)[1], options):
+    return fmt, raster.encode_webp(rasterize_sheet(legend, layouts, options), options)
+  return 'png', iter_sheet_png(legend, layouts, options)
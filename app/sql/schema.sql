@@ -52,3 +52,9 @@ CREATE TABLE holidays (
 	recurring BOOLEAN DEFAULT False
 );
 
+
+CREATE INDEX ix_objects_group_id ON objects (group_id);
+CREATE INDEX ix_absences_object_id_dates ON absences (object_id, abs_date_start, abs_date_end);
+CREATE INDEX ix_user_groups_group_id ON user_groups (group_id);
+CREATE INDEX ix_holidays_event_date ON holidays (event_date);
+CREATE INDEX ix_holidays_recurring ON holidays (recurring);
@@ -0,0 +1,40 @@
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+"""
+SQL statement budget of a request.
+With SQL_STATEMENT_LIMIT set, debug and testing applications count the statements
+every request executes and fail the request that exceeds the limit, so lazy loads
+in a loop (N+1 queries) show up in tests instead of in production.
+"""
+
+class StatementLimitExceeded(AssertionError):
+  pass
+
+# Counts statements of the current request, statements outside requests (CLI, pool) are ignored
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context():
+    g.sql_statements = g.get('sql_statements', 0) + 1
+
+class StatementGuard:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    if not app.config.get('SQL_STATEMENT_LIMIT'):
+      return
+    if not event.contains(Engine, 'before_cursor_execute', count_statement):
+      event.listen(Engine, 'before_cursor_execute', count_statement)
+    app.after_request(self.check)
+
+  # The limit may be changed after init_app, 0 still means no limit
+  def check(self, response):
+    limit = current_app.config['SQL_STATEMENT_LIMIT']
+    if not limit:
+      return response
+    count = g.get('sql_statements', 0)
+    if (current_app.debug or current_app.testing) and count > limit:
+      raise StatementLimitExceeded(f'{request.method} {request.path} executed {count} SQL statements, limit is {limit}')
+    return response
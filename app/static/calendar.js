@@ -0,0 +1,53 @@
+// Click handling of month images.
+// Absences and holidays are <area> elements of the image map, free cells are
+// resolved here from the geometry in data-click (see AbsMonth.gen_click_map).
+// Sprite sheet has a list of maps, each with top and height of its month (see sheet.py).
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('img[data-click]').forEach(function(img) {
+        var maps = [].concat(JSON.parse(img.dataset.click)).map(function(map) {
+            var rows = {};
+            map.rows.forEach(function(row) {
+                rows[row[0]] = {objectId: row[1], mask: row[2]};
+            });
+            return {map: map, rows: rows, top: map.top || 0, height: map.height || Infinity};
+        });
+
+        // Return {map, row, day} of free editable cell at image coordinates, else null
+        function cellAt(x, y) {
+            var month = maps.find(function(month) {
+                return y >= month.top && y < month.top + month.height;
+            });
+            if (!month) {
+                return null;
+            }
+            var map = month.map;
+            var row = month.rows[Math.floor((y - month.top) / (map.row_height + 1))];
+            var day = Math.floor((x - map.label_width) / (map.col_width + 1)) + 1;
+            if (!row || x < map.label_width || day < 1 || day > map.days) {
+                return null;
+            }
+            if (Math.floor(row.mask / Math.pow(2, day)) % 2) {
+                return null;
+            }
+            return {map: map, row: row, day: day};
+        }
+
+        function imageXY(event) {
+            var scale = img.naturalWidth / img.clientWidth || 1;
+            return [event.offsetX * scale, event.offsetY * scale];
+        }
+
+        img.addEventListener('mousemove', function(event) {
+            var cell = cellAt.apply(null, imageXY(event));
+            img.style.cursor = cell ? 'pointer' : '';
+            img.title = cell ? 'Add' : '';
+        });
+
+        img.addEventListener('click', function(event) {
+            var cell = cellAt.apply(null, imageXY(event));
+            if (cell) {
+                window.location = [cell.map.create_url, cell.row.objectId, cell.day, cell.map.month, cell.map.year, 1].join('/');
+            }
+        });
+    });
+});
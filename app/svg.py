@@ -0,0 +1,86 @@
+from html import escape
+from .fonts import get_font
+from . import layout as lt
+
+"""
+SVG writer of month layout (see layout.py).
+Emits rectangles, lines and text straight from the layout in the same order the
+rasterizer draws them, so there is no pixel work on the server and the image stays
+sharp on HiDPI screens. Text is stretched to the width measured with FiraCode, so
+fitted captions stay within their boxes whatever font the browser picks.
+"""
+
+FONT_FAMILY = "'Fira Code', FiraCode, monospace"
+
+# Pillow box (x1, y1, x2, y2) includes both end pixels
+def rect(box, fill):
+  x1, y1, x2, y2 = box
+  return f'<rect x="{x1}" y="{y1}" width="{x2-x1+1}" height="{y2-y1+1}" fill="{escape(color(fill))}"/>'
+
+# Pillow draws outline of given width inside the box
+def outline(box, stroke, width=2):
+  x1, y1, x2, y2 = box
+  inset = width / 2
+  return (f'<rect x="{x1+inset}" y="{y1+inset}" width="{x2-x1+1-width}" height="{y2-y1+1-width}" '
+          f'fill="none" stroke="{stroke}" stroke-width="{width}"/>')
+
+def line(coords, stroke):
+  x1, y1, x2, y2 = coords
+  return f'<line x1="{x1+0.5}" y1="{y1+0.5}" x2="{x2+0.5}" y2="{y2+0.5}" stroke="{stroke}" stroke-width="1"/>'
+
+# Pillow places top of the text at xy, SVG places baseline
+def text(xy, value, metrics, fill):
+  if not value:
+    return ''
+  x, y = xy
+  ascent = metrics.font.getmetrics()[0]
+  return (f'<text x="{x}" y="{y+ascent}" font-size="{metrics.size}" fill="{fill}" '
+          f'textLength="{metrics.textlength(value)}" lengthAdjust="spacingAndGlyphs">{escape(value)}</text>')
+
+def color(value):
+  if isinstance(value, tuple):
+    return '#%02x%02x%02x' % value
+  return value
+
+# y - vertical position when the month is nested in another SVG (see sheet.py)
+def render_svg(layout, y=None):
+  font = get_font(lt.FONT_SIZE)
+  title_font = get_font(lt.TITLE_FONT_SIZE)
+  position = '' if y is None else f' y="{y}"'
+  items = [
+    f'<svg xmlns="http://www.w3.org/2000/svg"{position} width="{layout.width}" height="{layout.height}" '
+    f'viewBox="0 0 {layout.width} {layout.height}" font-family="{escape(FONT_FAMILY)}" shape-rendering="crispEdges">',
+    f'<rect width="100%" height="100%" fill="{color(lt.BACKGROUND)}"/>'
+  ]
+
+  items += [rect(box, lt.WEEKEND) for box in layout.weekends]
+  items += [line(coords, lt.GRID) for coords in layout.vlines + layout.hlines]
+  items += [rect(box, lt.HOLIDAY) for day, box in layout.holidays]
+  items += [text(xy, value, font, lt.TEXT) for xy, value in layout.day_numbers]
+
+  if layout.padding:
+    items.append(rect(layout.padding, lt.PADDING))
+
+  for period in layout.periods:
+    items.append(rect(period.box, lt.CW))
+    if period.text_xy:
+      items.append(text(period.text_xy, period.text, font, lt.TEXT))
+
+  xy, value, title_color = layout.title
+  items.append(text(xy, value, title_font, title_color))
+
+  if layout.outline:
+    items.append(outline(layout.outline, lt.OUTLINE))
+
+  items += [text(row.label_xy, row.name, font, lt.TEXT) for row in layout.rows]
+
+  for span in layout.spans:
+    items.append(rect(span.box, span.color))
+    if span.caption_xy:
+      items.append(text(span.caption_xy, str(span.caption), font, lt.TEXT))
+
+  if layout.curday:
+    items.append(outline(layout.curday, lt.OUTLINE))
+
+  items.append('</svg>')
+  return '\n'.join(item for item in items if item).encode()
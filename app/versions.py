@@ -0,0 +1,212 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import g, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from .extensions import db
+from .models import DataVersion, Absence, Object, Group, User, UserGroup, Holiday, AbsenceType
+
+"""
+Data version counters.
+Every flush that changes absences, objects, groups, holidays or absence types bumps
+the related counters in data_versions table within the same transaction, so all
+gunicorn workers see the new version as soon as the change is committed.
+
+Counters:
+global                          - bulk changes that can not be attributed to a group
+types                           - absence types
+holidays                        - holidays
+groups                          - groups, their members and objects (reference data, see refdata.py)
+users                           - users (admin flag of cached principals, see principal.py)
+group:<group_id>                - objects and members of the group
+month:<group_id>:<year>:<month> - absences of the group in given month
+"""
+
+VersionStamp = namedtuple('VersionStamp', ['token', 'last_modified'])
+
+# Models which bulk updates/deletes bump the global counter
+GLOBAL_MODELS = (Absence, Object, Group, User, UserGroup)
+
+def group_key(group_id):
+    return f'group:{group_id}'
+
+def month_key(group_id, year, month):
+    return f'month:{group_id}:{year}:{month}'
+
+def month_keys(group_id, year, month):
+    return ['global', 'types', 'holidays', group_key(group_id), month_key(group_id, year, month)]
+
+# Return (year, month) tuples covered by date range
+def iter_months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+# Return old and current values of the attribute
+def attr_values(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    values = list(history.added) + list(history.unchanged) + list(history.deleted)
+    return [value for value in values if value is not None]
+
+def object_group_ids(session, object_ids):
+    group_ids = set()
+    with session.no_autoflush:
+        for object_id in object_ids:
+            obj = session.get(Object, object_id)
+            if obj is not None:
+                group_ids.update(attr_values(obj, 'group_id'))
+    return group_ids
+
+def absence_keys(session, absence):
+    group_ids = object_group_ids(session, attr_values(absence, 'object_id'))
+    starts = attr_values(absence, 'abs_date_start')
+    ends = attr_values(absence, 'abs_date_end')
+    if not starts or not ends:
+        return set()
+
+    keys = set()
+    for group_id in group_ids:
+        for year, month in iter_months(min(starts), max(ends)):
+            keys.add(month_key(group_id, year, month))
+    return keys
+
+# Memberships changed through User.groups are written as user_groups rows, no UserGroup object is flushed
+# Deleting a user deletes its memberships too
+def membership_keys(session, user):
+    history = inspect(user).attrs.groups.history
+    groups = list(history.added) + list(history.deleted)
+    if not groups and user not in session.deleted:
+        return set()
+    return {group_key(group.id) for group in groups if group.id} | {'groups'}
+
+def changed_keys(session, obj):
+    if isinstance(obj, Absence):
+        return absence_keys(session, obj)
+    if isinstance(obj, (Object, UserGroup)):
+        return {group_key(group_id) for group_id in attr_values(obj, 'group_id')} | {'groups'}
+    if isinstance(obj, Group):
+        return {group_key(obj.id), 'groups'} if obj.id else {'groups'}
+    if isinstance(obj, Holiday):
+        return {'holidays'}
+    if isinstance(obj, AbsenceType):
+        return {'types'}
+    if isinstance(obj, User):
+        return {'users'} | membership_keys(session, obj)
+    return set()
+
+def bump_versions(connection, keys):
+    if not keys:
+        return
+
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert
+    elif dialect == 'sqlite':
+        insert = sqlite.insert
+    else:
+        raise ValueError(f"Unsupported database dialect: {dialect}")
+
+    table = DataVersion.__table__
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    stmt = insert(table).values([{'name': key, 'version': 1, 'updated_at': now} for key in sorted(keys)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'version': table.c.version + 1, 'updated_at': now}
+    )
+    connection.execute(stmt)
+
+@event.listens_for(Session, 'before_flush')
+def collect_changes(session, flush_context, instances):
+    keys = session.info.setdefault('version_keys', set())
+    for obj in list(session.new) + list(session.deleted):
+        keys.update(changed_keys(session, obj))
+    for obj in list(session.dirty):
+        if session.is_modified(obj):
+            keys.update(changed_keys(session, obj))
+
+@event.listens_for(Session, 'after_flush')
+def store_changes(session, flush_context):
+    keys = session.info.pop('version_keys', None)
+    if keys:
+        bump_versions(session.connection(), keys)
+        session.info['versions_bumped'] = True
+        if has_app_context():
+            g.pop('data_versions', None)
+
+@event.listens_for(Session, 'after_commit')
+def versions_committed(session):
+    session.info.pop('versions_bumped', None)
+
+# Counters read in the rolled back transaction are gone with it
+@event.listens_for(Session, 'after_rollback')
+def versions_rolled_back(session):
+    if session.info.pop('versions_bumped', None) and has_app_context():
+        g.pop('data_versions', None)
+
+# Whether the session bumped counters which are not committed yet
+# Other workers can compute the same token for different data, values read now must not be cached
+def versions_pending(session):
+    return session.info.get('versions_bumped', False)
+
+# Query.update() / Query.delete() bypass the flush, bump counters for the whole model
+@event.listens_for(Session, 'do_orm_execute')
+def collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+
+    cls = mapper.class_
+    if cls is AbsenceType:
+        keys = {'types'}
+    elif cls is Holiday:
+        keys = {'holidays'}
+    elif issubclass(cls, GLOBAL_MODELS):
+        keys = {'global'}
+    else:
+        return
+
+    bump_versions(orm_execute_state.session.connection(), keys)
+    orm_execute_state.session.info['versions_bumped'] = True
+    if has_app_context():
+        g.pop('data_versions', None)
+
+# Return {name: (version, updated_at)} for given counters
+# Results are memoized for the duration of the request
+def get_versions(keys):
+    memo = g.setdefault('data_versions', {}) if has_app_context() else {}
+    missing = [key for key in keys if key not in memo]
+
+    if missing:
+        rows = db.session.query(DataVersion.name, DataVersion.version, DataVersion.updated_at)\
+            .filter(DataVersion.name.in_(missing)).all()
+        found = {row.name: (row.version, row.updated_at) for row in rows}
+        for key in missing:
+            memo[key] = found.get(key, (0, None))
+
+    return {key: memo[key] for key in keys}
+
+def version_stamp(keys):
+    versions = get_versions(keys)
+    token = '.'.join(str(versions[key][0]) for key in keys)
+    updated = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+    return VersionStamp(token, max(updated) if updated else None)
+
+# Current data version of the month calendar of given group
+def month_version(group_id, year, month):
+    return version_stamp(month_keys(group_id, year, month))
+
+# Fetch counters of several months with one query
+# keys - other counters read later in the request (e.g. refdata.REFERENCE_KEYS)
+def prefetch_month_versions(group_id, dates, keys=()):
+    keys = list(keys)
+    for day in dates:
+        keys.extend(month_keys(group_id, day.year, day.month))
+    get_versions(list(dict.fromkeys(keys)))
+
+def types_version():
+    return version_stamp(['types'])
@@ -0,0 +1,68 @@
+from collections import namedtuple
+from datetime import date
+from flask import abort, request, session
+from flask_login import current_user
+
+"""
+View window of the calendar: group, first month and number of months.
+The window is taken from GET query parameters (the navigation form fields), so every
+view has its own URL and the page and its images can be cached by URL. Without
+parameters the last window kept in session is used, then defaults.
+"""
+
+ViewWindow = namedtuple('ViewWindow', ['group_id', 'start_year', 'start_month', 'chunksize'])
+
+MAX_CHUNKSIZE = 13      # The same as NavForm chunksize choices
+FIRST_MONTH = (1, 1)    # First and last (year, month) the calendar shows, data of a month is queried
+LAST_MONTH = (9999, 11) # up to the first day of the next month which has to be a valid date too
+
+# Group of the request: ?group_id= when it is one of the user's groups, else the group kept in session
+def view_group_id():
+    group_id = request.args.get('group_id', type=int)
+    if group_id is None:
+        return session.get('group_id')
+    if group_id not in [group.id for group in current_user.groups]:
+        abort(404)
+    return group_id
+
+def view_window():
+    today = date.today()
+    window = ViewWindow(
+        view_group_id(),
+        request.args.get('start_year', session.get('start_year', today.year), type=int),
+        request.args.get('start_month', session.get('start_month', today.month), type=int),
+        request.args.get('chunksize', session.get('chunksize', 4), type=int)
+    )
+    if not 1 <= window.chunksize <= MAX_CHUNKSIZE or not window_in_range(window):
+        abort(404)
+    return window
+
+# Number of month counted from January of year 0
+def month_number(year, month):
+    return year * 12 + month - 1
+
+# Whether count months starting with given one are all within FIRST_MONTH and LAST_MONTH
+def months_in_range(year, month, count):
+    if not 1 <= month <= 12:
+        return False
+    first = month_number(year, month)
+    return month_number(*FIRST_MONTH) <= first and first + count - 1 <= month_number(*LAST_MONTH)
+
+# Whether the whole window can be shown
+def window_in_range(window):
+    return months_in_range(window.start_year, window.start_month, window.chunksize)
+
+# Keep window in session for pages without parameters, the session is written only when it changes
+def remember_window(window):
+    for key, value in window._asdict().items():
+        if value is not None and session.get(key) != value:
+            session[key] = value
+
+# Query parameters of url_for for given window
+def window_args(window):
+    return {key: value for key, value in window._asdict().items() if value is not None}
+
+# Window moved by given number of months, check the result with window_in_range
+def shift_window(window, months):
+    total = month_number(window.start_year, window.start_month) + months
+    return window._replace(start_year=total // 12, start_month=total % 12 + 1)
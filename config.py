@@ -9,22 +9,54 @@ class Config:
     DB_ADMIN_PASS = os.environ.get('DB_ADMIN_PASS')
     SECRET_KEY = os.getenv('SECRET_KEY', 'neverguessthis')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SESSION_TYPE = "sqlalchemy"
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sqlalchemy')           # sqlalchemy, cachelib (files in instance dir shared by workers) or cookie (signed cookie, no server storage)
     SESSION_PERMANENT = True
+    # Sessions are written only when they change, so a session expires PERMANENT_SESSION_LIFETIME after its last
+    # write (login, changed view window) and active users are logged out then, requests alone do not extend it.
+    # Flask-Session deletes an expired sqlalchemy row inline (delete and commit) when its cookie comes back, rows of
+    # sessions never presented again are deleted only by `make session-cleanup`, which has to run from cron.
+    SESSION_REFRESH_EACH_REQUEST = False
+    SESSION_CACHE_THRESHOLD = int(os.environ.get('SESSION_CACHE_THRESHOLD', 10000))  # Max number of sessions kept by cachelib backend
     SQLALCHEMY_DATABASE_URI = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
     USE_SESSION_FOR_NEXT = True
     SHOW_ALL_GROUP_OBJECTS = True       # Whether or not to show all objects in the group or just the user's objects
     MODIFY_ALL_GROUP_ABSENCES = False   # Whether or not to allow the user to modify all group absences or just their own object absences
+    RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR')                   # Defaults to <instance>/cache/render
+    RENDER_CACHE_TIMEOUT = int(os.environ.get('RENDER_CACHE_TIMEOUT', 300))  # Seconds a rendered month is kept
+    RENDER_CACHE_THRESHOLD = int(os.environ.get('RENDER_CACHE_THRESHOLD', 500))  # Max number of cached months before pruning
+    BASE_LAYER_CACHE_BYTES = int(os.environ.get('BASE_LAYER_CACHE_BYTES', 16*1024*1024))  # Per worker memory for month header and empty row layers
+    ROW_STRIP_CACHE_BYTES = int(os.environ.get('ROW_STRIP_CACHE_BYTES', 64*1024*1024))    # Per worker memory for rendered object rows, reused only when it holds objects x months of the window x 114KB
+    PNG_PALETTE = os.environ.get('PNG_PALETTE', 'True') == 'True'          # Write month images as palette (indexed) PNG
+    PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))      # zlib level 0-9, higher is smaller and slower
+    PNG_COMPRESS_TYPE = int(os.environ.get('PNG_COMPRESS_TYPE', 0))        # zlib strategy: 0 default, 1 filtered, 2 huffman only, 3 RLE, 4 fixed
+    PNG_BAND_ROWS = int(os.environ.get('PNG_BAND_ROWS', 64))               # Rows rasterized at a time for taller months, 0 - whole image at once
+    WEBP_METHOD = int(os.environ.get('WEBP_METHOD', 0))                    # Lossless WebP encoder method 0-6
+    WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', 100))                # Lossless WebP effort 0-100, higher is smaller and slower
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 0))              # Processes encoding months of a chunk in parallel per gunicorn worker, 0 - no pool, helps only with idle cores (flask bench executor)
+    IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 0))     # Seconds browser may reuse image without revalidation, 0 - always revalidate
+    # Sprite sheet serves legend and months of the page as one image with one image map instead of N+2 image requests,
+    # but it is drawn and encoded serially in the request worker (RENDER_WORKERS is not used) and a change of any
+    # month re-encodes the whole sheet, while single month images are encoded in the pool and re-encoded one by one
+    SPRITE_SHEET = os.environ.get('SPRITE_SHEET', 'False') == 'True'      # Worth it for small groups and high latency clients
+    SQL_STATEMENT_LIMIT = int(os.environ.get('SQL_STATEMENT_LIMIT', 0))     # Fail debug and testing requests executing more SQL statements, 0 - no limit
+    PRINCIPAL_CACHE_TIMEOUT = int(os.environ.get('PRINCIPAL_CACHE_TIMEOUT', 60))  # Seconds the logged in user is kept in cache, it is reloaded after any change of users or groups anyway, 0 - load from database every request
     
 class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = "sqlite:///app.db"
    
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')         # In memory SQLite by default
+    SQL_STATEMENT_LIMIT = int(os.environ.get('SQL_STATEMENT_LIMIT', 15))               # Statement budget enforced by tests
+
 class ProductionConfig(Config):
     # SQLALCHEMY_DATABASE_URI = "sqlite:///app.db"
     pass
 
 config = {
     'development': DevelopmentConfig,
+    'testing': TestingConfig,
     'production': ProductionConfig
 }
 
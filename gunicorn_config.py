@@ -3,3 +3,8 @@ from dotenv import load_dotenv
 load_dotenv()
 bind = "0.0.0.0:8000"
 workers = 4
+
+# Start render process pool (RENDER_WORKERS) of every worker before its first request
+def post_worker_init(worker):
+    from app.extensions import render_executor
+    render_executor.start()
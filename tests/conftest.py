@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+import pytest
+
+# Testing configuration is read when config.py is imported, render cache goes to a throwaway directory
+RENDER_CACHE_DIR = tempfile.mkdtemp(prefix='absences-render-')
+os.environ['FLASK_ENV'] = 'testing'
+os.environ['RENDER_CACHE_DIR'] = RENDER_CACHE_DIR
+
+from app import create_app
+from app.cli import init_db_helper, populate_db_helper
+from app import refdata
+from app.extensions import db, render_cache, base_layers, row_strips
+from app.models import Absence, AbsenceType, Group, Object, UserGroup
+
+"""
+Application on in memory SQLite (TEST_DATABASE_URL to use another database),
+populated like `flask init-db` and `flask populate-db` plus a group of objects
+with absences over the next year, a second group of admin with one object
+and a large group of admin for the statement budget of absence forms.
+The application is created once, Flask-Session registers its model on db.
+"""
+
+OBJECTS = 20
+OTHER_OBJECT = 'Other group person'
+LARGE_OBJECTS = 500
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    with app.app_context():
+        init_db_helper()
+        populate_db_helper()
+
+        type_ids = [row.id for row in db.session.query(AbsenceType.id)]
+        first_day = date.today().replace(day=1)
+        for i in range(OBJECTS):
+            obj = Object(user_id=1, group_id=1, name=f'Person {i}', description='')
+            db.session.add(obj)
+            db.session.flush()
+            for month in range(0, 13, 2):
+                start = first_day + timedelta(days=month*30 + i % 20)
+                db.session.add(Absence(object_id=obj.id, type_id=type_ids[i % len(type_ids)], abs_date_start=start,
+                                       abs_date_end=start + timedelta(days=i % 5), description='Test'))
+
+        other = Group(user_id=1, name='Other', description='Second group')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(UserGroup(user_id=1, group_id=other.id))
+        db.session.add(Object(user_id=1, group_id=other.id, name=OTHER_OBJECT, description=''))
+
+        large = Group(user_id=1, name='Large', description='Large group')
+        db.session.add(large)
+        db.session.flush()
+        db.session.add(UserGroup(user_id=1, group_id=large.id))
+        db.session.add_all(Object(user_id=1, group_id=large.id, name=f'Large {i}', description='') for i in range(LARGE_OBJECTS))
+        db.session.commit()
+        db.session.remove()
+
+    # Requests push their own application context, so g (and the statement count) is per request
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+    shutil.rmtree(RENDER_CACHE_DIR, ignore_errors=True)
+
+# Logged in admin, every test starts with empty render and reference data caches
+@pytest.fixture
+def client(app):
+    refdata.clear()
+    render_cache.clear()
+    base_layers.clear()
+    row_strips.clear()
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,16 @@
+from app import refdata
+from app.extensions import db
+from app.models import AbsenceType
+
+# Reference data read after a flush is not cached, the transaction may still be rolled back
+def test_uncommitted_reference_data_not_cached(app):
+    with app.app_context():
+        committed = refdata.absence_types()
+
+        db.session.add(AbsenceType(name='Uncommitted', color='black'))
+        db.session.flush()
+        assert 'Uncommitted' in [row.name for row in refdata.absence_types()]
+
+        db.session.rollback()
+        assert refdata.absence_types() == committed
+        db.session.remove()
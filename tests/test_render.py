@@ -0,0 +1,28 @@
+from datetime import date, datetime
+from conftest import OTHER_OBJECT
+from app import render
+from app.versions import VersionStamp
+
+# Month image shows the group of the request, not the group remembered in session by the previous page
+def test_month_image_of_requested_group(client):
+    today = date.today()
+    assert client.get('/?group_id=2').status_code == 200
+
+    group_one = client.get(f'/month/{today.year}/{today.month}?group_id=1&fmt=svg')
+    assert b'Person 0' in group_one.data
+    assert OTHER_OBJECT.encode() not in group_one.data
+
+    client.get('/?group_id=1')
+    group_two = client.get(f'/month/{today.year}/{today.month}?group_id=2&fmt=svg')
+    assert OTHER_OBJECT.encode() in group_two.data
+    assert b'Person 0' not in group_two.data
+
+# Counters start again after database reset and drawing changes with deploys, the legend must not be reused then
+def test_legend_etag_changes_with_reset_and_render_format(monkeypatch):
+    types = VersionStamp('1', datetime(2026, 1, 1))
+    reset = VersionStamp('1', datetime(2026, 2, 1))
+    assert render.legend_etag(types) != render.legend_etag(reset)
+
+    etag = render.legend_etag(types)
+    monkeypatch.setattr(render, 'RENDER_FORMAT', render.RENDER_FORMAT + 1)
+    assert render.legend_etag(types) != etag
@@ -0,0 +1,87 @@
+from datetime import date
+import pytest
+from flask import g, request_finished
+from app.extensions import db, render_cache
+from app.models import Absence, Group, Object
+from app.statements import StatementLimitExceeded
+
+def window_url(chunksize):
+    today = date.today()
+    return f'/?group_id=1&start_year={today.year}&start_month={today.month}&chunksize={chunksize}'
+
+# Cold index of a multi-month window renders every month, data of all months is loaded in one batch
+# With sprite sheet the page has one merged image map instead of one per month
+@pytest.mark.parametrize('sheet, maps', [(True, 1), (False, 13)])
+def test_index_window_within_statement_budget(app, client, monkeypatch, sheet, maps):
+    monkeypatch.setitem(app.config, 'SPRITE_SHEET', sheet)
+    statements = []
+
+    def record(sender, response):
+        statements.append(g.get('sql_statements', 0))
+
+    with request_finished.connected_to(record, app):
+        response = client.get(window_url(13))
+        assert response.status_code == 200
+        assert response.data.count(b'<map name=') == maps
+        assert 0 < statements[-1] <= app.config['SQL_STATEMENT_LIMIT']
+
+        # Number of statements does not grow with the window
+        render_cache.clear()
+        client.get(window_url(1))
+        assert statements[-1] <= statements[-2]
+
+def test_index_over_budget_fails(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_STATEMENT_LIMIT', 1)
+    with pytest.raises(StatementLimitExceeded):
+        client.get(window_url(13))
+
+def test_zero_limit_means_no_limit(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_STATEMENT_LIMIT', 0)
+    assert client.get(window_url(13)).status_code == 200
+
+# Absence in the large group, edited or deleted by the test
+@pytest.fixture
+def large_absence(app):
+    with app.app_context():
+        group_id = db.session.query(Group.id).filter(Group.name == 'Large').scalar()
+        objects = db.session.query(Object.id).filter(Object.group_id == group_id).order_by(Object.id).limit(2).all()
+        absence = Absence(object_id=objects[0].id, type_id=1, abs_date_start=date(2030, 1, 7), abs_date_end=date(2030, 1, 9), description='Large')
+        db.session.add(absence)
+        db.session.commit()
+        ids = {'absence_id': absence.id, 'object_id': objects[0].id, 'other_object_id': objects[1].id}
+        db.session.remove()
+
+    yield ids
+
+    with app.app_context():
+        db.session.query(Absence).filter(Absence.object_id.in_([ids['object_id'], ids['other_object_id']])).delete()
+        db.session.commit()
+        db.session.remove()
+
+def absence_form(object_id, start, end, absence_id=None):
+    form = {'object_id': object_id, 'type_id': 1, 'abs_date_start': start, 'abs_date_end': end, 'description': 'Budget'}
+    if absence_id:
+        form['id'] = absence_id
+    return form
+
+# Requests of absence forms, object choices list every object of admin's groups
+ABSENCE_REQUESTS = {
+    'create': lambda client, ids: client.get('/absences/create'),
+    'create_post': lambda client, ids: client.post('/absences/create', data=absence_form(ids['other_object_id'], '2030-02-03', '2030-02-04')),
+    'edit': lambda client, ids: client.get(f"/absences/edit/{ids['absence_id']}"),
+    'edit_post': lambda client, ids: client.post('/absences/edit', data=absence_form(ids['object_id'], '2030-01-14', '2030-01-15', ids['absence_id'])),
+    'delete': lambda client, ids: client.get(f"/absences/delete/{ids['absence_id']}")
+}
+
+# Number of statements does not grow with the number of objects of a large group
+@pytest.mark.parametrize('name', ABSENCE_REQUESTS)
+def test_absence_forms_within_statement_budget(app, client, large_absence, name):
+    statements = []
+
+    def record(sender, response):
+        statements.append(g.get('sql_statements', 0))
+
+    with request_finished.connected_to(record, app):
+        response = ABSENCE_REQUESTS[name](client, large_absence)
+    assert response.status_code in (200, 302)
+    assert 0 < statements[-1] <= app.config['SQL_STATEMENT_LIMIT']
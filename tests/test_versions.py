@@ -0,0 +1,32 @@
+from app import refdata
+from app.extensions import db
+from app.models import Group, User
+from app.versions import get_versions, group_key
+
+def committed_versions(keys):
+    db.session.remove()
+    return {key: version for key, (version, _) in get_versions(keys).items()}
+
+# Membership changed through User.groups invalidates reference data of groups
+def test_user_groups_change_bumps_groups(app):
+    with app.app_context():
+        group = Group(user_id=1, name='Membership', description='')
+        db.session.add(group)
+        db.session.commit()
+        group_id = group.id
+        keys = ['users', 'groups', group_key(group_id)]
+
+        before = committed_versions(keys)
+        assert group_id not in [row.id for row in refdata.user_groups(1)]
+
+        user = db.session.get(User, 1)
+        user.groups.append(db.session.get(Group, group_id))
+        db.session.commit()
+
+        after = committed_versions(keys)
+        assert all(after[key] == before[key] + 1 for key in keys)
+        assert group_id in [row.id for row in refdata.user_groups(1)]
+
+        db.session.delete(db.session.get(Group, group_id))
+        db.session.commit()
+        db.session.remove()
@@ -0,0 +1,28 @@
+import pytest
+
+def window_url(start_year, start_month, chunksize):
+    return f'/?group_id=1&start_year={start_year}&start_month={start_month}&chunksize={chunksize}'
+
+# Windows ending outside of the calendar range are not found instead of failing
+@pytest.mark.parametrize('url', [
+    window_url(9999, 12, 2),
+    window_url(9999, 11, 2),
+    window_url(0, 12, 1),
+    '/month/0/12',
+    '/month/9999/12',
+    '/months/9999/10/3',
+])
+def test_window_out_of_range(client, url):
+    assert client.get(url).status_code == 404
+
+# Prev and Next links are shown only when their windows can be shown
+@pytest.mark.parametrize('url, prev, next', [
+    (window_url(1, 1, 4), False, True),
+    (window_url(9999, 10, 2), True, False),
+    (window_url(2020, 1, 4), True, True),
+])
+def test_navigation_links_in_range(client, url, prev, next):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert (b'id="prev"' in response.data) == prev
+    assert (b'id="next"' in response.data) == next